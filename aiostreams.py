@@ -0,0 +1,486 @@
+import os
+import grpc
+import time
+import asyncio
+import functools
+import collections
+import frame_pb2_grpc
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sender import SEND_MODE_STREAM, SEND_MODE_UNARY, SEND_MODE_BATCH, AckQueue, InFlight, StreamClosed, WindowedSender
+from batching import BatchDispatcher
+from backends import create_router, is_failover_error
+from pipeline import build_pipeline, STATE_FAILED
+
+class StreamLimitReached(Exception):
+    pass
+
+class AsyncLatestQueue:
+    def __init__(self, loop, maxsize: int = 1):
+        self.loop    = loop
+        self.items   = collections.deque()
+        self.maxsize = max(1, maxsize)
+        self.ready   = asyncio.Event()
+        self.closed  = False
+        self.dropped = 0
+
+    def put(self, item):
+        # the capture stage runs in an executor thread and hands frames over to the loop
+        try:
+            self.loop.call_soon_threadsafe(self.put_nowait, item)
+        except RuntimeError:
+            pass
+
+    def put_nowait(self, item):
+        if len(self.items) >= self.maxsize:
+            self.items.popleft()
+            self.dropped += 1
+
+        self.items.append(item)
+        self.ready.set()
+
+    async def get(self):
+        while not self.items:
+            if self.closed:
+                return None
+
+            self.ready.clear()
+            await self.ready.wait()
+
+        return self.items.popleft()
+
+    def close(self):
+        try:
+            self.loop.call_soon_threadsafe(self._close)
+        except RuntimeError:
+            pass
+
+    def _close(self):
+        self.closed = True
+        self.ready.set()
+
+    def __len__(self):
+        return len(self.items)
+
+class AioChannels:
+    def __init__(self):
+        self.channels = {}
+
+    def stub(self, backend):
+        stub = self.channels.get(backend.target)
+        if stub is None:
+            channel = grpc.aio.insecure_channel(backend.target, options = backend.pool.options, compression = backend.pool.compression)
+            stub    = self.channels[backend.target] = (channel, frame_pb2_grpc.FrameServiceStub(channel))
+
+        return stub[1]
+
+    async def close(self):
+        channels = [channel for channel, _ in self.channels.values()]
+        self.channels.clear()
+
+        for channel in channels:
+            await channel.close()
+
+def resolve(outcome, error = None):
+    # a waiter that timed out has already given up on the outcome
+    if outcome.done():
+        return
+
+    if error is not None:
+        outcome.set_exception(error)
+    else:
+        outcome.set_result(None)
+
+class AsyncFrameStream:
+    def __init__(self, stub, timeout: float = 5.0):
+        self.timeout = timeout
+        self.acks    = AckQueue()
+        self.call    = stub.StreamFramesAcked()
+        self.reader  = asyncio.create_task(self._read())
+
+    async def _read(self):
+        error = None
+        try:
+            while True:
+                ack = await self.call.read()
+                if ack is grpc.aio.EOF:
+                    break
+
+                self.acks.ack()
+        except grpc.aio.AioRpcError as e:
+            error = e
+        except asyncio.CancelledError:
+            # cancelling a write cancels the whole call, its frames are spooled like those of a stream closed on timeout
+            error = TimeoutError("frame stream cancelled before every frame was acknowledged")
+
+        self.acks.fail(error or StreamClosed("frame stream closed by server"))
+
+    async def write(self, message):
+        try:
+            await asyncio.wait_for(self.call.write(message), self.timeout)
+        except (grpc.aio.AioRpcError, grpc.aio.UsageError, asyncio.InvalidStateError, asyncio.TimeoutError) as e:
+            # writing to a finished call only says so, the reader fails what is pending with the status of the call
+            if not isinstance(e, asyncio.TimeoutError):
+                await asyncio.wait([self.reader], timeout = self.timeout)
+
+            self.acks.fail(e)
+            self.call.cancel()
+
+    async def close(self, timeout: float = 0):
+        if not self.acks.broken() and timeout:
+            try:
+                await asyncio.wait_for(self.call.done_writing(), timeout)
+            except (grpc.RpcError, grpc.aio.UsageError, asyncio.InvalidStateError, asyncio.TimeoutError):
+                pass
+
+        await asyncio.wait([self.reader], timeout = timeout)
+        if not self.reader.done():
+            self.acks.fail(TimeoutError("frame stream closed before every frame was acknowledged"))
+            self.call.cancel()
+            await asyncio.wait([self.reader])
+
+class AsyncFrameSender(WindowedSender):
+    def __init__(self, router, channels: AioChannels, limits: dict, camera_id: str, mode: str = SEND_MODE_STREAM, window: int = 8, timeout: float = 5.0, dispatcher = None):
+        super().__init__(router, camera_id, mode, window, timeout, dispatcher)
+        self.channels  = channels
+        self.limits    = limits
+        self.slots     = asyncio.Semaphore(self.window)
+        self.fallbacks = set()
+
+    def _limit(self, backend):
+        limit = self.limits.get(backend.target)
+        if limit is None:
+            limit = self.limits[backend.target] = asyncio.Semaphore(backend.limit)
+
+        return limit
+
+    async def send(self, message, done = None):
+        if done is None:
+            outcome = asyncio.get_running_loop().create_future()
+            await self.send(message, functools.partial(resolve, outcome))
+
+            return await asyncio.wait_for(outcome, self.timeout * 2)
+
+        backend = self.router.route(self.camera_id)
+        if backend is not self.backend:
+            await self._reset_stream(self.timeout)
+            self.backend = backend
+            self.stub    = self.channels.stub(backend)
+
+        limit = self._limit(backend)
+        try:
+            await self._acquire(limit)
+        except asyncio.TimeoutError as e:
+            done(e)
+            return
+
+        # the loop-side semaphore already bounds the frames in flight, so this never blocks
+        backend.acquire(0)
+
+        def release():
+            limit.release()
+            self.slots.release()
+
+        frame = InFlight(backend, release, done)
+        try:
+            if self.mode == SEND_MODE_STREAM:
+                await self._send_stream(message, frame)
+                return
+
+            if self.mode == SEND_MODE_BATCH:
+                loop = asyncio.get_running_loop()
+                self._submit(backend, message).add_done_callback(lambda future: loop.call_soon_threadsafe(frame, future.exception()))
+                return
+
+            await self.stub.SendFrame(message, timeout = self.timeout)
+        except asyncio.CancelledError:
+            # a frame already written to the stream is completed by its ack, or failed when the sender closes
+            if not frame.queued:
+                frame.abandon()
+            raise
+        except Exception as e:
+            frame(e)
+            return
+
+        frame()
+
+    async def _acquire(self, limit):
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._full()
+
+        try:
+            await asyncio.wait_for(limit.acquire(), self.timeout)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    async def _send_stream(self, message, frame):
+        error = self._held(frame.backend)
+        if error is not None:
+            frame.refuse(error)
+            return
+
+        if self.stream is None or self.stream.acks.broken():
+            await self._reset_stream()
+            self.stream = AsyncFrameStream(self.stub, self.timeout)
+
+        stream = self.stream
+        stream.acks.push(self._acked(self.stub, message, frame))
+        frame.queued = True
+
+        await stream.write(message)
+
+    def _fallback(self, stub, message, frame):
+        task = asyncio.create_task(self._resend(stub, message, frame))
+        self.fallbacks.add(task)
+        task.add_done_callback(self.fallbacks.discard)
+
+    async def _resend(self, stub, message, frame):
+        try:
+            await stub.SendFrame(message, timeout = self.timeout)
+        except Exception as e:
+            frame(e)
+            return
+
+        frame()
+
+    async def _reset_stream(self, timeout: float = 0):
+        stream, self.stream = self.stream, None
+        if stream is not None:
+            await stream.close(timeout)
+
+    async def _drain(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        taken    = 0
+        try:
+            while taken < self.window:
+                await asyncio.wait_for(self.slots.acquire(), max(0, deadline - time.monotonic()))
+                taken += 1
+        except asyncio.TimeoutError:
+            pass
+
+        for _ in range(taken):
+            self.slots.release()
+
+    async def close(self):
+        if self.mode == SEND_MODE_BATCH:
+            await self._drain(self.timeout * 2)
+
+        await self._reset_stream(self.timeout)
+        if self.fallbacks:
+            await asyncio.wait(self.fallbacks, timeout = self.timeout)
+
+class AsyncCameraStream:
+    def __init__(self, pipeline, sender: AsyncFrameSender, capture_executor, encode_executor, replay_sender: AsyncFrameSender = None):
+        self.pipeline         = pipeline
+        self.sender           = sender
+        self.replay_sender    = replay_sender
+        self.capture_executor = capture_executor
+        self.encode_executor  = encode_executor
+        self.tasks            = []
+        self.stores           = set()
+        self.capture          = None
+
+    @property
+    def running(self):
+        return self.pipeline.running
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+
+        self.pipeline.frames   = AsyncLatestQueue(loop, self.pipeline.frames.maxsize)
+        self.pipeline.messages = AsyncLatestQueue(loop, self.pipeline.messages.maxsize)
+        self.pipeline.prepare()
+
+        self.capture = loop.run_in_executor(self.capture_executor, self.pipeline._capture)
+        self.tasks   = [
+            asyncio.create_task(self._encode(), name = f"encode-{self.pipeline.camera_id}"),
+            asyncio.create_task(self._send(), name = f"send-{self.pipeline.camera_id}"),
+        ]
+        if self.pipeline.spool is not None:
+            self.tasks.append(asyncio.create_task(self._replay(), name = f"replay-{self.pipeline.camera_id}"))
+
+    async def _encode(self):
+        job = None
+        try:
+            while self.pipeline.running:
+                item = await self.pipeline.frames.get()
+                if item is None:
+                    continue
+
+                job     = self.encode_executor.submit(self.pipeline.encode_item, item)
+                encoded = await asyncio.wrap_future(job)
+                if encoded is not None:
+                    self.pipeline.messages.put_nowait(encoded)
+        finally:
+            # cancelling the task does not stop a running encode, which may still be writing into the ring
+            if job is not None and not job.done():
+                await asyncio.wait([asyncio.wrap_future(job)])
+            self.pipeline.release()
+
+    async def _send(self):
+        try:
+            while self.pipeline.running:
+                item = await self.pipeline.messages.get()
+                if item is None:
+                    continue
+
+                messages, captured = item
+                for message in messages:
+                    if not self.pipeline.synced(message):
+                        continue
+
+                    await self.sender.send(message, functools.partial(self.completed, message, captured, time.monotonic()))
+        finally:
+            await self.sender.close()
+            if self.stores:
+                await asyncio.wait(self.stores)
+
+    def completed(self, message, captured: float, start: float, error = None):
+        if error is None:
+            self.pipeline.sent(message, captured, start)
+            return
+
+        self.pipeline.failed(error, start)
+        if self.pipeline.spool is not None and is_failover_error(error):
+            # stored off the loop, the spool is only closed once every store has finished
+            store = asyncio.get_running_loop().run_in_executor(self.encode_executor, self.pipeline.store, message)
+            self.stores.add(store)
+            store.add_done_callback(self.stores.discard)
+
+    async def _replay(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pipeline.running:
+                record = await loop.run_in_executor(self.encode_executor, self.pipeline.spool.next)
+                if record is None:
+                    await asyncio.sleep(1.0)
+                    continue
+
+                message, offset = record
+                try:
+                    await self.replay_sender.send(message)
+                    delay = self.pipeline.replayed(offset)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    delay = self.pipeline.replayed(offset, e)
+
+                await asyncio.sleep(delay)
+        finally:
+            await self.replay_sender.close()
+
+    async def stop(self, timeout: float = 5.0):
+        self.pipeline.stop()
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.tasks, return_exceptions = True)
+        # closed here rather than by the tasks, a task cancelled before it ever ran has no finally to run
+        self.pipeline.close_spool()
+        if self.capture is not None:
+            # the capture thread notices the stop between reads, a hung read is left to finish on its own
+            await asyncio.wait([self.capture], timeout = timeout)
+
+class AsyncStreamManager:
+    def __init__(self, router_config: dict, send_mode: str, max_cameras: int = 64, encode_threads: int = None, window: int = 8, batch: dict = None):
+        self.router           = create_router(**router_config)
+        self.channels         = AioChannels()
+        self.limits           = {}
+        self.send_mode        = send_mode
+        self.dispatcher       = BatchDispatcher(**(batch or {})) if send_mode == SEND_MODE_BATCH else None
+        self.max_cameras      = max_cameras
+        self.window           = window
+        self.capture_executor = ThreadPoolExecutor(max_workers = max_cameras, thread_name_prefix = "capture")
+        self.encode_executor  = ThreadPoolExecutor(max_workers = encode_threads or os.cpu_count() or 1, thread_name_prefix = "encode")
+        self.streams          = {}
+
+    def running(self, camera_id: str):
+        stream = self.streams.get(camera_id)
+
+        return stream is not None and stream.running
+
+    async def start(self, spec: dict):
+        if self.running(spec["camera_id"]):
+            return False
+
+        stale = self.streams.pop(spec["camera_id"], None)
+        if stale is not None:
+            await stale.stop()
+
+        if len(self.streams) >= self.max_cameras:
+            raise StreamLimitReached(f"the async stream manager is limited to {self.max_cameras} cameras")
+
+        sender   = AsyncFrameSender(self.router, self.channels, self.limits, spec["camera_id"], mode = self.send_mode, window = self.window, dispatcher = self.dispatcher)
+        replay   = AsyncFrameSender(self.router, self.channels, self.limits, spec["camera_id"], mode = SEND_MODE_UNARY) if spec.get("spool") else None
+        pipeline = build_pipeline(spec, sender_factory = None)
+        stream   = AsyncCameraStream(pipeline, sender, self.capture_executor, self.encode_executor, replay)
+
+        self.streams[spec["camera_id"]] = stream
+        stream.start()
+
+        return True
+
+    async def stop(self, camera_id: str, timeout: float = 5.0):
+        stream = self.streams.pop(camera_id, None)
+        if stream is None:
+            return False
+
+        await stream.stop(timeout)
+
+        return True
+
+    def status(self):
+        return [
+            stream.pipeline.status()
+            for stream in self.streams.values()
+            if stream.running or stream.pipeline.state == STATE_FAILED
+        ]
+
+    def latency(self):
+        return {camera_id: stream.pipeline.latency.snapshot() for camera_id, stream in self.streams.items()}
+
+    def metrics(self):
+        return {camera_id: stream.pipeline.metrics() for camera_id, stream in self.streams.items()}
+
+    async def snapshot(self, camera_id: str, known = ()):
+        if not self.running(camera_id):
+            return None
+
+        # a frame without a cached encoding is encoded off the loop
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self.encode_executor, self.streams[camera_id].pipeline.snapshot, known)
+
+    def reconfigure(self, camera_id: str, detector: dict = None, regions: list = None):
+        if not self.running(camera_id):
+            return False
+
+        # the encode stage reads both on its next frame
+        self.streams[camera_id].pipeline.reconfigure(detector, regions)
+
+        return True
+
+    def backends(self):
+        data = self.router.status()
+        if self.dispatcher is not None:
+            for backend in data:
+                backend["batch"] = self.dispatcher.status(backend["target"])
+
+        return data
+
+    async def shutdown(self, timeout: float = 5.0):
+        streams = list(self.streams.values())
+        self.streams.clear()
+
+        await asyncio.gather(*(stream.stop(timeout) for stream in streams), return_exceptions = True)
+        await self.channels.close()
+        if self.dispatcher is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.dispatcher.close)
+
+        self.capture_executor.shutdown(wait = False, cancel_futures = True)
+        self.encode_executor.shutdown(wait = False, cancel_futures = True)
+        self.router.close()
@@ -1,33 +1,51 @@
 import os
-import io
-import cv2
-import grpc
+import time
+import math
+import asyncio
+import inspect
 import secrets
-import threading
-import frame_pb2
-import frame_pb2_grpc
+
+from backends import create_router, parse_targets
+from workers import LocalWorker, WorkerSupervisor, worker_count
+from capture import SYNTHETIC_SCHEME
+from aiostreams import AsyncStreamManager, StreamLimitReached
+from metrics import CONTENT_TYPE, Registry, camera_registry, instrument_provider
+from ttlcache import TTLCache, ExpiringSet
+from calibrations import CalibrationCache
+from ratelimit import RateLimiter
+from passwords import PasswordBusy, PasswordExecutor, create_hasher
 
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
-from pony.orm import db_session, commit, select
-from models import db, GaugeCalibration, GaugeType, CctvConnection, User
+from pony.orm import db_session, commit, select, exists
+from models import db, GaugeCalibration, GaugeType, CctvConnection, User, upgrade_schema, user_listeners, set_password_hasher
 
-from PIL import Image
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from dotenv import load_dotenv
-from typing import Any, Optional
-from fastapi.responses import JSONResponse
-from fastapi import FastAPI, HTTPException, Query, Response, Request, Depends
+from typing import Any, List, Literal, Optional
+from urllib.parse import quote, urlsplit, urlunsplit
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi import FastAPI, HTTPException, Query, Response, Request, Depends, BackgroundTasks
 from fastapi import APIRouter, Depends
 
 load_dotenv(override=True)
 
-db_file = "db.sqlite"
+db_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db.sqlite")
 db_exists = os.path.exists(db_file)
 
+if db_exists:
+    upgrade_schema(db_file)
+
 db.bind(provider='sqlite', filename=db_file, create_db=not db_exists)
 db.generate_mapping(create_tables=True)
 
+app_metrics = Registry()
+app_metrics.describe("lugh_http_request_seconds", "histogram", "HTTP request latency per route")
+app_metrics.describe("lugh_http_requests_total", "counter", "HTTP requests per route and status code")
+instrument_provider(db.provider, app_metrics)
+
 @db_session
 def seed_users():
     users = [
@@ -50,13 +68,128 @@ ALGORITHM    = os.getenv("JWT_ALGORITHM", "HS256")
 
 ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("JWT_EXPIRE_IN_MINUTE", 60)
 
+AUTH_CACHE_SIZE  = int(os.getenv("AUTH_CACHE_SIZE", 1024))
+AUTH_CACHE_TTL_S = float(os.getenv("AUTH_CACHE_TTL_S", 60))
+
+ARGON2_TIME_COST   = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_KIB  = int(os.getenv("ARGON2_MEMORY_KIB", 65536))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+
+LOGIN_HASH_THREADS     = int(os.getenv("LOGIN_HASH_THREADS", 2))
+LOGIN_HASH_QUEUE       = int(os.getenv("LOGIN_HASH_QUEUE", 32))
+LOGIN_MAX_FAILURES     = int(os.getenv("LOGIN_MAX_FAILURES", 5))
+LOGIN_FAILURE_WINDOW_S = float(os.getenv("LOGIN_FAILURE_WINDOW_S", 300))
+
+GRPC_SEND_MODE     = os.getenv("GRPC_SEND_MODE", "stream")
+GRPC_STREAM_WINDOW = int(os.getenv("GRPC_STREAM_WINDOW", 8))
+GRPC_BATCH_SIZE    = int(os.getenv("GRPC_BATCH_SIZE", 16))
+GRPC_BATCH_WAIT_MS = float(os.getenv("GRPC_BATCH_WAIT_MS", 20))
+PIPELINE_QUEUE     = int(os.getenv("PIPELINE_QUEUE_SIZE", 1))
+
+GRPC_CHANNEL_POOL_SIZE = int(os.getenv("GRPC_CHANNEL_POOL_SIZE", 4))
+GRPC_KEEPALIVE_MS      = int(os.getenv("GRPC_KEEPALIVE_MS", 30000))
+GRPC_MAX_MESSAGE_MB    = int(os.getenv("GRPC_MAX_MESSAGE_MB", 16))
+GRPC_COMPRESSION       = os.getenv("GRPC_COMPRESSION", "none")
+
+GRPC_BACKEND_INFLIGHT = int(os.getenv("GRPC_BACKEND_INFLIGHT", 64))
+GRPC_BACKEND_FAILURES = int(os.getenv("GRPC_BACKEND_FAILURES", 3))
+GRPC_BACKEND_COOLDOWN = float(os.getenv("GRPC_BACKEND_COOLDOWN_S", 10))
+
+STREAM_TARGET_FPS     = float(os.getenv("STREAM_TARGET_FPS", 0))
+STREAM_JPEG_QUALITY   = int(os.getenv("STREAM_JPEG_QUALITY", 80))
+STREAM_ADAPTIVE       = os.getenv("STREAM_ADAPTIVE", "false").lower() == "true"
+ADAPTIVE_MIN_FPS      = float(os.getenv("ADAPTIVE_MIN_FPS", 0.2))
+ADAPTIVE_MIN_QUALITY  = int(os.getenv("ADAPTIVE_MIN_QUALITY", 30))
+ADAPTIVE_LATENCY_MS   = float(os.getenv("ADAPTIVE_LATENCY_MS", 200))
+
+STREAM_CHANGE_THRESHOLD = float(os.getenv("STREAM_CHANGE_THRESHOLD", 0))
+STREAM_HEARTBEAT_S      = float(os.getenv("STREAM_HEARTBEAT_S", 30))
+STREAM_CHANGE_WIDTH     = int(os.getenv("STREAM_CHANGE_WIDTH", 160))
+
+STREAM_WORKERS = worker_count(os.getenv("STREAM_WORKERS", "0"))
+
+STREAM_RUNTIME        = os.getenv("STREAM_RUNTIME", "threads")
+STREAM_MAX_CAMERAS    = int(os.getenv("STREAM_MAX_CAMERAS", 64))
+STREAM_ENCODE_THREADS = int(os.getenv("STREAM_ENCODE_THREADS", 0))
+
+STREAM_RTSP_TRANSPORT = os.getenv("STREAM_RTSP_TRANSPORT") or None
+STREAM_FFMPEG_OPTIONS = os.getenv("STREAM_FFMPEG_OPTIONS") or None
+STREAM_GRAB_SKIPPED   = os.getenv("STREAM_GRAB_SKIPPED", "true").lower() == "true"
+
+STREAM_CODEC            = os.getenv("STREAM_CODEC", "jpeg")
+STREAM_JPEG_OPTIMIZE    = os.getenv("STREAM_JPEG_OPTIMIZE", "false").lower() == "true"
+STREAM_JPEG_SUBSAMPLING = os.getenv("STREAM_JPEG_SUBSAMPLING") or None
+STREAM_PNG_COMPRESSION  = int(os.getenv("STREAM_PNG_COMPRESSION", 1))
+
+FRAME_TRANSPORT = os.getenv("FRAME_TRANSPORT", "inline")
+SHM_SLOTS       = int(os.getenv("SHM_SLOTS", 16))
+SHM_SLOT_MB     = float(os.getenv("SHM_SLOT_MB", 4))
+
+FRAME_SPOOL_DIR         = os.getenv("FRAME_SPOOL_DIR") or None
+FRAME_SPOOL_MAX_MB      = float(os.getenv("FRAME_SPOOL_MAX_MB", 512))
+FRAME_SPOOL_SEGMENT_MB  = float(os.getenv("FRAME_SPOOL_SEGMENT_MB", 16))
+FRAME_SPOOL_RETENTION_H = float(os.getenv("FRAME_SPOOL_RETENTION_H", 24))
+FRAME_SPOOL_SAMPLE      = int(os.getenv("FRAME_SPOOL_SAMPLE", 1))
+FRAME_SPOOL_REPLAY_FPS  = float(os.getenv("FRAME_SPOOL_REPLAY_FPS", 10))
+
+SNAPSHOT_MJPEG_MAX_FPS = float(os.getenv("SNAPSHOT_MJPEG_MAX_FPS", 5))
+
+STREAM_AUTOSTART         = os.getenv("STREAM_AUTOSTART", "false").lower() == "true"
+STREAM_START_CONCURRENCY = int(os.getenv("STREAM_START_CONCURRENCY", 4))
+STREAM_START_STAGGER_MS  = float(os.getenv("STREAM_START_STAGGER_MS", 250))
+
+STREAM_READ_FAILURES      = int(os.getenv("STREAM_READ_FAILURES", 10))
+STREAM_BACKOFF_INITIAL_S  = float(os.getenv("STREAM_BACKOFF_INITIAL_S", 1))
+STREAM_BACKOFF_MAX_S      = float(os.getenv("STREAM_BACKOFF_MAX_S", 60))
+STREAM_RECONNECT_ATTEMPTS = int(os.getenv("STREAM_RECONNECT_ATTEMPTS", 0))
+
+# synthetic:// cameras are a load test source, bench_load turns them on
+STREAM_ALLOW_SYNTHETIC = os.getenv("STREAM_ALLOW_SYNTHETIC", "false").lower() == "true"
+
 class ConnectRequest(BaseModel):
-    camera_id  : str
-    rtsp_url   : str
+    camera_id    : str
+    rtsp_url     : str
+    cctv_id      : Optional[int] = None
+    target_fps   : Optional[float] = Field(None, gt = 0)
+    jpeg_quality : Optional[int] = Field(None, ge = 10, le = 100)
+    adaptive     : Optional[bool] = None
+
+    change_threshold  : Optional[float] = Field(None, ge = 0, le = 1)
+    heartbeat_seconds : Optional[float] = Field(None, gt = 0)
+
+    rtsp_transport : Optional[Literal["tcp", "udp"]] = None
+    ffmpeg_options : Optional[str] = None
+    grab_skipped   : Optional[bool] = None
+
+    codec : Optional[Literal["jpeg", "webp", "png-gray", "raw", "passthrough"]] = None
+
+class BulkConnectRequest(BaseModel):
+    cameras : List[ConnectRequest] = Field(..., min_length = 1)
+
+class BulkDisconnectRequest(BaseModel):
+    camera_ids : List[str] = Field(..., min_length = 1)
 
 class CalibrationRequest(BaseModel):
-    gauge_type      : int
-    cctv_connection : int
+    gauge_type        : int
+    cctv_connection   : int
+    change_threshold  : Optional[float] = Field(None, ge = 0, le = 1)
+    heartbeat_seconds : Optional[float] = Field(None, gt = 0)
+    roi_x             : Optional[int] = Field(None, ge = 0)
+    roi_y             : Optional[int] = Field(None, ge = 0)
+    roi_width         : Optional[int] = Field(None, gt = 0)
+    roi_height        : Optional[int] = Field(None, gt = 0)
+    clear_roi         : bool = False
+
+    @model_validator(mode = "after")
+    def check_roi(self):
+        # a region needs all four values, one sent alone would be stored but never cropped
+        given = [value is not None for value in (self.roi_x, self.roi_y, self.roi_width, self.roi_height)]
+        if any(given) and not all(given):
+            raise ValueError("roi_x, roi_y, roi_width and roi_height must be given together")
+        if all(given) and self.clear_roi:
+            raise ValueError("clear_roi cannot be combined with a new roi")
+
+        return self
 
 class CalibrationTypeRequest(BaseModel):
     max_value    : int
@@ -81,44 +214,168 @@ class ResponseAPI(BaseModel):
     message     : Optional[str] = None
     data        : Optional[Any] = None
 
-def stream_to_grpc(camera_id: str, rtsp_url: str):
-    print(f"attempting to connect from to {rtsp_url}")
+def create_policy(req: ConnectRequest):
+    return {
+        "target_fps"   : req.target_fps if req.target_fps is not None else STREAM_TARGET_FPS,
+        "quality"      : req.jpeg_quality if req.jpeg_quality is not None else STREAM_JPEG_QUALITY,
+        "adaptive"     : req.adaptive if req.adaptive is not None else STREAM_ADAPTIVE,
+        "min_fps"      : ADAPTIVE_MIN_FPS,
+        "min_quality"  : ADAPTIVE_MIN_QUALITY,
+        "latency_high" : ADAPTIVE_LATENCY_MS / 1000,
+    }
 
-    channel = grpc.insecure_channel(GRPC_ADDRESS)
-    stub = frame_pb2_grpc.FrameServiceStub(channel)
+# streams read their calibration from memory, sqlite is only queried at startup and when an endpoint changes it
+calibration_cache = CalibrationCache()
+
+# the request each running camera was started with and the calibration version it last received
+connected_cameras = {}
+
+def calibration_config(cctv):
+    return {
+        "url"          : cctv.url,
+        "calibrations" : [
+            {
+                "id"                : cal.id,
+                "change_threshold"  : cal.change_threshold,
+                "heartbeat_seconds" : cal.heartbeat_seconds,
+                "roi"               : cal.roi(),
+                "gauge_type"        : {
+                    "id"           : cal.gauge_type.id,
+                    "max_value"    : cal.gauge_type.max_value,
+                    "min_value"    : cal.gauge_type.min_value,
+                    "start_degree" : cal.gauge_type.start_degree,
+                    "end_degree"   : cal.gauge_type.end_degree,
+                    "needle_type"  : cal.gauge_type.needle_type,
+                },
+            }
+            for cal in sorted(cctv.calibrations, key = lambda cal: cal.id)
+        ],
+    }
 
-    cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+@db_session
+def load_calibrations(cctv_ids: list = None):
+    query = CctvConnection.select() if cctv_ids is None else CctvConnection.select(lambda c: c.id in cctv_ids)
+    query = query.prefetch(CctvConnection.calibrations, GaugeCalibration.gauge_type)
 
-    if not cap.isOpened():
-        print(f"unable to connect to {rtsp_url}")
-        running_streams[camera_id] = False
-        return
-    
-    print(f"connected to {rtsp_url}")
+    return {cctv.id: calibration_config(cctv) for cctv in query}
+
+def invalidate_calibrations(cctv_ids):
+    # committed first, so the cache never holds a change the database rolled back
+    commit()
 
-    while running_streams[camera_id]:
-        ret, frame = cap.read()
-        if not ret:
+    cctv_ids = sorted(set(cctv_ids))
+    cameras  = load_calibrations(cctv_ids)
+    for cctv_id in cctv_ids:
+        calibration_cache.update(cctv_id, cameras.get(cctv_id))
+
+async def push_calibrations():
+    for camera_id, (req, applied) in list(connected_cameras.items()):
+        cctv_id, version, calibrations = calibration_cache.lookup(req.cctv_id, req.rtsp_url)
+        if (cctv_id, version) == applied:
             continue
-        
-        _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-        frame_bytes = buffer.tobytes()
 
-        img = Image.open(io.BytesIO(frame_bytes))
-        w, h = img.size
+        if await call_streams("reconfigure", camera_id, create_detector(req, calibrations), create_regions(calibrations)):
+            connected_cameras[camera_id] = (req, (cctv_id, version))
+            print(f"camera with id of {camera_id} now uses calibration version {version}")
+
+def create_detector(req: ConnectRequest, calibrations: list):
+    thresholds = [cal["change_threshold"] for cal in calibrations if cal["change_threshold"] is not None]
+    heartbeats = [cal["heartbeat_seconds"] for cal in calibrations if cal["heartbeat_seconds"] is not None]
+
+    threshold = req.change_threshold if req.change_threshold is not None else min(thresholds, default = STREAM_CHANGE_THRESHOLD)
+    heartbeat = req.heartbeat_seconds if req.heartbeat_seconds is not None else min(heartbeats, default = STREAM_HEARTBEAT_S)
+
+    if not threshold:
+        return None
+
+    return {
+        "threshold" : threshold,
+        "heartbeat" : heartbeat,
+        "width"     : STREAM_CHANGE_WIDTH,
+        "regions"   : [roi for _, roi in create_regions(calibrations)],
+    }
+
+def create_regions(calibrations: list):
+    return [(cal["id"], cal["roi"]) for cal in calibrations if cal["roi"] is not None]
+
+def create_capture(req: ConnectRequest):
+    return {
+        "transport"       : req.rtsp_transport or STREAM_RTSP_TRANSPORT,
+        "ffmpeg_options"  : req.ffmpeg_options if req.ffmpeg_options is not None else STREAM_FFMPEG_OPTIONS,
+        "grab_skipped"    : req.grab_skipped if req.grab_skipped is not None else STREAM_GRAB_SKIPPED,
+        "read_failures"   : STREAM_READ_FAILURES,
+        "backoff_initial" : STREAM_BACKOFF_INITIAL_S,
+        "backoff_max"     : STREAM_BACKOFF_MAX_S,
+        "max_attempts"    : STREAM_RECONNECT_ATTEMPTS,
+    }
+
+def create_codec(req: ConnectRequest):
+    name = req.codec or STREAM_CODEC
 
-        message = frame_pb2.Frame(camera_id = camera_id, width = w, height = h, data = frame_bytes)
+    if name == "jpeg":
+        return {"name": name, "optimize": STREAM_JPEG_OPTIMIZE, "subsampling": STREAM_JPEG_SUBSAMPLING}
+    if name == "png-gray":
+        return {"name": name, "compression": STREAM_PNG_COMPRESSION}
 
-        try:
-            stub.SendFrame(message)
-        except Exception as e:
-            print(f"unable to send frame data to grpc server")
-            print(str(e))
+    return {"name": name}
 
-    cap.release()
-    running_streams[camera_id] = False
-    print(f"the streaming data of camera with id of {camera_id} has ended")
+def create_shared():
+    if FRAME_TRANSPORT != "shm":
+        return None
+
+    return {"slots": SHM_SLOTS, "slot_size": int(SHM_SLOT_MB * 1024 * 1024)}
+
+def create_spool():
+    if FRAME_SPOOL_DIR is None:
+        return None
+
+    return {
+        "root"          : FRAME_SPOOL_DIR,
+        "max_bytes"     : int(FRAME_SPOOL_MAX_MB * 1024 * 1024),
+        "segment_bytes" : int(FRAME_SPOOL_SEGMENT_MB * 1024 * 1024),
+        "retention"     : FRAME_SPOOL_RETENTION_H * 3600,
+        "sample_every"  : FRAME_SPOOL_SAMPLE,
+        "replay_fps"    : FRAME_SPOOL_REPLAY_FPS,
+    }
+
+def create_spec(req: ConnectRequest, calibrations: list):
+    return {
+        "camera_id"  : req.camera_id,
+        "rtsp_url"   : req.rtsp_url,
+        "queue_size" : PIPELINE_QUEUE,
+        "policy"     : create_policy(req),
+        "detector"   : create_detector(req, calibrations),
+        "regions"    : create_regions(calibrations),
+        "capture"    : create_capture(req),
+        "codec"      : create_codec(req),
+        "shared"     : create_shared(),
+        "spool"      : create_spool(),
+    }
+
+def create_streams():
+    router_config = {
+        "targets"        : parse_targets(GRPC_ADDRESS),
+        "pool_size"      : GRPC_CHANNEL_POOL_SIZE,
+        "keepalive_ms"   : GRPC_KEEPALIVE_MS,
+        "max_message_mb" : GRPC_MAX_MESSAGE_MB,
+        "compression"    : GRPC_COMPRESSION,
+        "inflight"       : GRPC_BACKEND_INFLIGHT,
+        "max_failures"   : GRPC_BACKEND_FAILURES,
+        "cooldown"       : GRPC_BACKEND_COOLDOWN,
+    }
+
+    batch_config = {
+        "max_size" : GRPC_BATCH_SIZE,
+        "max_wait" : GRPC_BATCH_WAIT_MS / 1000,
+    }
+
+    if STREAM_RUNTIME == "async":
+        return AsyncStreamManager(router_config, GRPC_SEND_MODE, STREAM_MAX_CAMERAS, STREAM_ENCODE_THREADS or None, GRPC_STREAM_WINDOW, batch_config)
+
+    if STREAM_WORKERS:
+        return WorkerSupervisor(STREAM_WORKERS, router_config, GRPC_SEND_MODE, GRPC_STREAM_WINDOW, batch_config)
+
+    return LocalWorker(create_router(**router_config), GRPC_SEND_MODE, GRPC_STREAM_WINDOW, batch_config)
 
 def get_response_format(http_code: int, message: str = None, status: str = "success", data: Any = None):
     return ResponseAPI(
@@ -128,79 +385,332 @@ def get_response_format(http_code: int, message: str = None, status: str = "succ
         data      = data,
     )
 
+def get_roi_format(cal):
+    roi = cal.roi()
+    if roi is None:
+        return None
+
+    return {"x": roi[0], "y": roi[1], "width": roi[2], "height": roi[3]}
+
+# argon2 runs on its own small pool so a burst of logins cannot take every threadpool worker from the api
+password_hasher   = create_hasher(ARGON2_TIME_COST, ARGON2_MEMORY_KIB, ARGON2_PARALLELISM)
+password_executor = PasswordExecutor(password_hasher, LOGIN_HASH_THREADS, LOGIN_HASH_QUEUE)
+login_limiter     = RateLimiter(LOGIN_MAX_FAILURES, LOGIN_FAILURE_WINDOW_S)
+
+set_password_hasher(password_hasher)
+
+@db_session
+def find_login(email: str):
+    user = User.get(email=email)
+    if not user:
+        return None
+
+    return {"id": user.id, "password": user.password}
+
 @db_session
-def get_current_user(request: Request):
+def update_password_hash(user_id: int, password: str):
+    user = User.get(id=user_id)
+    if user:
+        user.password = password
+
+def paginate(query, page: int, page_size: int, cursor: int = None):
+    # one extra row tells whether another page follows without counting the whole table
+    if cursor is not None:
+        rows = query.filter(lambda row: row.id > cursor).order_by(lambda row: row.id)[:page_size + 1]
+        meta = {"page_size": page_size, "cursor": cursor}
+    else:
+        start = (page - 1) * page_size
+        rows  = query.order_by(lambda row: row.id)[start:start + page_size + 1]
+        meta  = {"page": page, "page_size": page_size, "total": query.count()}
+
+    rows                = list(rows)
+    meta["next_cursor"] = rows[page_size - 1].id if len(rows) > page_size else None
+
+    return rows[:page_size], meta
+
+# validated tokens map to a snapshot of their user, so most requests skip the jwt decode and the user query
+auth_cache    = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_S)
+# revocations are never evicted early, a forgotten one would make a logged out token valid again
+revoked_tokens = ExpiringSet()
+
+def invalidate_user(user_id):
+    auth_cache.discard(lambda user: user["id"] == user_id)
+
+user_listeners.append(invalidate_user)
+
+def token_ttl(payload: dict):
+    exp = payload.get("exp")
+    if exp is None:
+        return None
+
+    return exp - time.time()
+
+@db_session
+def find_user(user_id):
+    user = User.get(id=user_id)
+    if not user:
+        return None
+
+    return {"id": user.id, "name": user.name, "email": user.email}
+
+async def get_current_user(request: Request):
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
+    # checked before the cache, a token revoked while it was cached must not keep working
+    if token in revoked_tokens:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    user = auth_cache.get(token)
+    if user is not None:
+        return user
+
     try:
-        print(token)
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = User.get(id=user_id)
+    user = await run_in_threadpool(find_user, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
 
+    # a logout that ran during the lookup revoked the token after the first check
+    if token in revoked_tokens:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    auth_cache.put(token, user, token_ttl(payload))
+
     return user
 
-threads = {}
-running_streams = {}
+streams = None
 wits0_connection = False
 
-app = FastAPI()
+def get_streams():
+    global streams
+    if streams is None:
+        streams = create_streams()
+
+    return streams
+
+async def call_streams(name: str, *args):
+    method = getattr(get_streams(), name)
+    if inspect.iscoroutinefunction(method):
+        return await method(*args)
+
+    # the async manager lives on the event loop, the threaded ones may block on joins and worker pipes
+    if isinstance(streams, AsyncStreamManager):
+        return method(*args)
+
+    return await run_in_threadpool(method, *args)
+
+MJPEG_BOUNDARY = "frame"
+
+async def mjpeg_frames(camera_id: str, fps: float):
+    etag = None
+    while True:
+        snapshot = await call_streams("snapshot", camera_id, (etag,) if etag else ())
+        if snapshot is None:
+            return
+
+        # an unchanged frame is not sent again, the viewer keeps showing the last part
+        if snapshot["data"] is not None:
+            etag = snapshot["etag"]
+            yield f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {snapshot['data'].nbytes}\r\n\r\n".encode()
+            yield memoryview(snapshot["data"])
+            yield b"\r\n"
+
+        await asyncio.sleep(1 / fps)
+
+async def connect_camera(req: ConnectRequest):
+    if urlsplit(req.rtsp_url).scheme == SYNTHETIC_SCHEME and not STREAM_ALLOW_SYNTHETIC:
+        raise HTTPException(status_code = 400, detail = "synthetic cameras are disabled, set STREAM_ALLOW_SYNTHETIC=true for load tests")
+
+    if await call_streams("running", req.camera_id):
+        return "running"
+
+    cctv_id, version, calibrations = calibration_cache.lookup(req.cctv_id, req.rtsp_url)
+
+    await call_streams("start", create_spec(req, calibrations))
+    connected_cameras[req.camera_id] = (req, (cctv_id, version))
+
+    return "started"
+
+async def connect_cameras(reqs: List[ConnectRequest]):
+    limit   = asyncio.Semaphore(max(1, STREAM_START_CONCURRENCY))
+    stagger = STREAM_START_STAGGER_MS / 1000
+    unique  = list({req.camera_id: req for req in reqs}.values())
+
+    async def start(req: ConnectRequest):
+        async with limit:
+            try:
+                result = {"camera_id": req.camera_id, "status": await connect_camera(req)}
+            except Exception as e:
+                result = {"camera_id": req.camera_id, "status": "error", "message": str(e)}
+
+            # holding the slot a little longer spaces out the RTSP handshakes and decoder start-ups
+            if result["status"] == "started":
+                await asyncio.sleep(stagger)
+
+            return result
+
+    return await asyncio.gather(*(start(req) for req in unique))
+
+async def disconnect_cameras(camera_ids: List[str]):
+    async def stop(camera_id: str):
+        stopped = await call_streams("stop", camera_id)
+        connected_cameras.pop(camera_id, None)
+
+        return {"camera_id": camera_id, "status": "stopped" if stopped else "missing"}
+
+    return await asyncio.gather(*(stop(camera_id) for camera_id in dict.fromkeys(camera_ids)))
+
+def get_cctv_url(cctv):
+    parts = urlsplit(cctv.url)
+    if not cctv.user or parts.username or not parts.netloc:
+        return cctv.url
+
+    credentials = quote(cctv.user, safe = "")
+    if cctv.password:
+        credentials += ":" + quote(cctv.password, safe = "")
+
+    return urlunsplit(parts._replace(netloc = f"{credentials}@{parts.netloc}"))
+
+@db_session
+def find_autostart_cameras():
+    return [
+        ConnectRequest(camera_id = str(cctv.id), rtsp_url = get_cctv_url(cctv), cctv_id = cctv.id)
+        for cctv in select(c for c in CctvConnection if exists(c.calibrations)).order_by(CctvConnection.id)
+    ]
+
+async def autostart_cameras():
+    cameras = await run_in_threadpool(find_autostart_cameras)
+    print(f"auto-starting {len(cameras)} calibrated cameras")
+
+    results = await connect_cameras(cameras)
+    failed  = [result["camera_id"] for result in results if result["status"] == "error"]
+    if failed:
+        print(f"unable to auto-start cameras with ids of {', '.join(failed)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_streams()
+    autostart = asyncio.create_task(autostart_cameras()) if STREAM_AUTOSTART else None
+
+    yield
+
+    if autostart is not None:
+        autostart.cancel()
+        await asyncio.gather(autostart, return_exceptions = True)
+
+    await call_streams("shutdown")
+    password_executor.shutdown()
+
+app = FastAPI(lifespan = lifespan)
 router = APIRouter(dependencies=[Depends(get_current_user)], tags=["Protected"])
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start    = time.perf_counter()
+    response = await call_next(request)
+    route    = request.scope.get("route")
+    labels   = (("method", request.method), ("route", route.path if route is not None else "unmatched"))
+
+    app_metrics.observe("lugh_http_request_seconds", labels, time.perf_counter() - start)
+    app_metrics.inc("lugh_http_requests_total", labels + (("status", response.status_code),))
+
+    return response
+
 seed_users()
+calibration_cache.load(load_calibrations())
+print(f"calibration cache loaded {calibration_cache.status()}")
 
 #-- GRPC endpoints
 
 @router.post("/connect", response_model = ResponseAPI, response_model_exclude_none = True)
-def start_camera_connection(req: ConnectRequest):
+async def start_camera_connection(req: ConnectRequest):
     camera_id = req.camera_id
-    if camera_id in running_streams and running_streams[camera_id] == True:
+    try:
+        status = await connect_camera(req)
+    except StreamLimitReached as e:
+        raise HTTPException(status_code = 503, detail = str(e))
+
+    if status == "running":
         message = f"Camera {camera_id} is already connected"
         return get_response_format(200, message = message)
-    
-    running_streams[camera_id] = True
-    t = threading.Thread(
-        target=stream_to_grpc,
-        args=(camera_id, req.rtsp_url),
-        daemon=True
-    )
-
-    threads[camera_id] = t
-    t.start()
 
     return get_response_format(200)
 
+@router.post("/bulk/connect", response_model = ResponseAPI, response_model_exclude_none = True)
+async def start_camera_connections(req: BulkConnectRequest):
+    response = get_response_format(200, data = await connect_cameras(req.cameras))
+
+    return response
+
+@router.post("/bulk/disconnect", response_model = ResponseAPI, response_model_exclude_none = True)
+async def stop_camera_connections(req: BulkDisconnectRequest):
+    response = get_response_format(200, data = await disconnect_cameras(req.camera_ids))
+
+    return response
+
 @router.post("/disconnect/{camera_id}", response_model = ResponseAPI, response_model_exclude_none = True)
-def stop_camera_connection(camera_id: str):
-    if camera_id not in running_streams:
+async def stop_camera_connection(camera_id: str):
+    connected_cameras.pop(camera_id, None)
+    if not await call_streams("stop", camera_id):
         message  = f"connection with camera id of {camera_id} does not exist"
         response = get_response_format(200, message = message)
         
         return response
 
-    running_streams[camera_id] = False
-
     return get_response_format(200)
 
 @router.get("/status", response_model = ResponseAPI, response_model_exclude_none = True)
-def stop_camera_connection():
-    connection = [cam for cam, active in running_streams.items() if active]
+async def stop_camera_connection():
+    connection = await call_streams("status")
     response   = get_response_format(200, data = connection)
 
     return response
 
+@router.get("/status/backends", response_model = ResponseAPI, response_model_exclude_none = True)
+async def get_backend_status():
+    response = get_response_format(200, data = await call_streams("backends"))
+
+    return response
+
+@router.get("/status/latency", response_model = ResponseAPI, response_model_exclude_none = True)
+async def get_latency_status():
+    response = get_response_format(200, data = await call_streams("latency"))
+
+    return response
+
+@router.get("/snapshot/{camera_id}")
+async def get_snapshot(camera_id: str, request: Request, mjpeg: bool = False, fps: float = Query(None, gt = 0)):
+    if mjpeg:
+        if not await call_streams("running", camera_id):
+            raise HTTPException(status_code = 404, detail = f"Camera {camera_id} is not connected")
+
+        fps = min(fps or SNAPSHOT_MJPEG_MAX_FPS, SNAPSHOT_MJPEG_MAX_FPS)
+
+        return StreamingResponse(mjpeg_frames(camera_id, fps), media_type = f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}")
+
+    # if-none-match uses the weak comparison, a W/ prefix added by a proxy still matches
+    known    = tuple(tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",") if tag.strip())
+    snapshot = await call_streams("snapshot", camera_id, known)
+    if snapshot is None:
+        raise HTTPException(status_code = 404, detail = f"No frame available for camera {camera_id}")
+
+    headers = {"ETag": snapshot["etag"], "Cache-Control": "no-cache"}
+    if snapshot["data"] is None:
+        return Response(status_code = 304, headers = headers)
+
+    return Response(content = memoryview(snapshot["data"]), media_type = "image/jpeg", headers = headers)
+
 #-- CALIBRATION endpoints
 
 @router.get("/calibration", response_model=ResponseAPI, response_model_exclude_none=True)
 @db_session
-def get_calibration(gauge_type: int = None, cctv_connection: int = None, page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100)):
+def get_calibration(gauge_type: int = None, cctv_connection: int = None, page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100), cursor: int = Query(None, ge=0)):
     query = select(cal for cal in GaugeCalibration)
 
     if gauge_type is not None:
@@ -208,11 +718,15 @@ def get_calibration(gauge_type: int = None, cctv_connection: int = None, page: i
     if cctv_connection is not None:
         query = query.filter(lambda cal: cal.cctv_connection.id == cctv_connection)
 
-    start = (page - 1) * page_size
-    end   = start + page_size
-    data  = [
+    # the related rows of a page are loaded together instead of once per calibration
+    query      = query.prefetch(GaugeCalibration.gauge_type, GaugeCalibration.cctv_connection)
+    rows, meta = paginate(query, page, page_size, cursor)
+    data       = [
         {
             "id": cal.id,
+            "change_threshold": cal.change_threshold,
+            "heartbeat_seconds": cal.heartbeat_seconds,
+            "roi": get_roi_format(cal),
             "gauge_type": {
                 "max_value": cal.gauge_type.max_value,
                 "min_value": cal.gauge_type.min_value,
@@ -227,21 +741,18 @@ def get_calibration(gauge_type: int = None, cctv_connection: int = None, page: i
                 "password": cal.cctv_connection.password
             }
         }
-        for cal in query[start:end]
+        for cal in rows
     ]
 
-    total    = query.count() if hasattr(query, "count") else len(query)
-    response = get_response_format(200, data = {"data" : data, "page": page, "page_size": page_size, "total": total})
+    response = get_response_format(200, data = {"data" : data, **meta})
 
     return response
 
 @router.get("/calibration/cctv", response_model=ResponseAPI, response_model_exclude_none=True)
 @db_session
-def get_calibration_cctv(page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100)):
-    query = CctvConnection.select()
-    start = (page - 1) * page_size
-    end   = start + page_size
-    data  = [
+def get_calibration_cctv(page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100), cursor: int = Query(None, ge=0)):
+    rows, meta = paginate(CctvConnection.select(), page, page_size, cursor)
+    data       = [
         {
             "id"       : cal.id,
             "url"      : cal.url,
@@ -249,21 +760,18 @@ def get_calibration_cctv(page: int = Query(1, ge=1), page_size: int = Query(10,
             "user"     : cal.user,
             # "password" : cal.password
         }
-        for cal in query[start:end]
+        for cal in rows
     ]
 
-    total    = query.count() if hasattr(query, "count") else len(query)
-    response = get_response_format(200, data = {"data" : data, "page": page, "page_size": page_size, "total": total})
+    response = get_response_format(200, data = {"data" : data, **meta})
 
     return response
 
 @router.get("/calibration/type", response_model=ResponseAPI, response_model_exclude_none=True)
 @db_session
-def get_calibration_type(page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100)):
-    query = GaugeType.select()
-    start = (page - 1) * page_size
-    end   = start + page_size
-    data  = [
+def get_calibration_type(page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100), cursor: int = Query(None, ge=0)):
+    rows, meta = paginate(GaugeType.select(), page, page_size, cursor)
+    data       = [
         {
             "id"           : cal.id,
             "max_value"    : cal.max_value,
@@ -272,25 +780,43 @@ def get_calibration_type(page: int = Query(1, ge=1), page_size: int = Query(10,
             "end_degree"   : cal.end_degree,
             "needle_type"  : cal.needle_type
         }
-        for cal in query[start:end]
+        for cal in rows
     ]
 
-    total    = query.count() if hasattr(query, "count") else len(query)
-    response = get_response_format(200, data = {"data" : data, "page": page, "page_size": page_size, "total": total})
+    response = get_response_format(200, data = {"data" : data, **meta})
     
     return response
 
 @router.post("/calibration", response_model = ResponseAPI, response_model_exclude_none = True)
 @db_session
-def store_calibration(req: CalibrationRequest):
-    query    = GaugeCalibration(gauge_type = req.gauge_type, cctv_connection = req.cctv_connection)
-    response = get_response_format(200, data = {"gauge_type": query.gauge_type.id, "cctv_connection": query.cctv_connection.id})
+def store_calibration(req: CalibrationRequest, background_tasks: BackgroundTasks):
+    query = GaugeCalibration(
+        gauge_type        = req.gauge_type,
+        cctv_connection   = req.cctv_connection,
+        change_threshold  = req.change_threshold,
+        heartbeat_seconds = req.heartbeat_seconds,
+        roi_x             = req.roi_x,
+        roi_y             = req.roi_y,
+        roi_width         = req.roi_width,
+        roi_height        = req.roi_height
+    )
+    data = {
+        "gauge_type"        : query.gauge_type.id,
+        "cctv_connection"   : query.cctv_connection.id,
+        "change_threshold"  : query.change_threshold,
+        "heartbeat_seconds" : query.heartbeat_seconds,
+        "roi"               : get_roi_format(query)
+    }
+    invalidate_calibrations([query.cctv_connection.id])
+    background_tasks.add_task(push_calibrations)
+
+    response = get_response_format(200, data = data)
 
     return response
 
 @router.post("/calibration/cctv", response_model = ResponseAPI, response_model_exclude_none = True)
 @db_session
-def store_calibration_cctv(req: CalibrationCCTVRequest):
+def store_calibration_cctv(req: CalibrationCCTVRequest, background_tasks: BackgroundTasks):
     query = CctvConnection(
         url      = req.url,
         name     = req.name,
@@ -303,6 +829,11 @@ def store_calibration_cctv(req: CalibrationCCTVRequest):
         "user"     : query.user,
         # "password" : query.password
     }
+    # committed for its id, a camera connected by this url before the cctv existed picks it up
+    commit()
+    invalidate_calibrations([query.id])
+    background_tasks.add_task(push_calibrations)
+
     response = get_response_format(200, data = data)
 
     return response
@@ -330,28 +861,44 @@ def store_calibration_type(req: CalibrationTypeRequest):
 
 @router.put("/calibration/{id}", response_model = ResponseAPI, response_model_exclude_none = True)
 @db_session
-def update_calibration(id: int, req: CalibrationRequest):
+def update_calibration(id: int, req: CalibrationRequest, background_tasks: BackgroundTasks):
     query = GaugeCalibration.get(id=id)
     if not query:
         raise HTTPException(status_code = 404, detail = "Item not found")
+
+    previous = query.cctv_connection.id
     
     if req.gauge_type is not None:
         query.gauge_type = req.gauge_type
     if req.cctv_connection is not None:
         query.cctv_connection = req.cctv_connection
+    if req.change_threshold is not None:
+        query.change_threshold = req.change_threshold
+    if req.heartbeat_seconds is not None:
+        query.heartbeat_seconds = req.heartbeat_seconds
+    if req.clear_roi:
+        query.set(roi_x = None, roi_y = None, roi_width = None, roi_height = None)
+    elif req.roi_x is not None:
+        query.set(roi_x = req.roi_x, roi_y = req.roi_y, roi_width = req.roi_width, roi_height = req.roi_height)
     
     data = {
-        "id"              : query.id,
-        "gauge_type"      : query.gauge_type.id, 
-        "cctv_connection" : query.cctv_connection.id
+        "id"                : query.id,
+        "gauge_type"        : query.gauge_type.id, 
+        "cctv_connection"   : query.cctv_connection.id,
+        "change_threshold"  : query.change_threshold,
+        "heartbeat_seconds" : query.heartbeat_seconds,
+        "roi"               : get_roi_format(query)
     }
+    invalidate_calibrations([previous, query.cctv_connection.id])
+    background_tasks.add_task(push_calibrations)
+
     response = get_response_format(200, data = data)
 
     return response
 
 @router.put("/calibration/type/{id}", response_model = ResponseAPI, response_model_exclude_none = True)
 @db_session
-def update_calibration_type(id: int, req: CalibrationTypeRequest):
+def update_calibration_type(id: int, req: CalibrationTypeRequest, background_tasks: BackgroundTasks):
     query = GaugeType.get(id=id)
     if not query:
         raise HTTPException(status_code = 404, detail = "Item not found")
@@ -375,18 +922,24 @@ def update_calibration_type(id: int, req: CalibrationTypeRequest):
         "end_degree"   : query.end_degree,
         "needle_type"  : query.needle_type
     }
+    invalidate_calibrations([cal.cctv_connection.id for cal in query.calibrations])
+    background_tasks.add_task(push_calibrations)
+
     response = get_response_format(200, data = data)
 
     return response
 
 @router.delete("/calibration/{id}", response_model = ResponseAPI, response_model_exclude_none = True)
 @db_session
-def delete_calibration(id: int):
+def delete_calibration(id: int, background_tasks: BackgroundTasks):
     query = GaugeCalibration.get(id = id)
     if not query:
         raise HTTPException(status_code=404, detail="Item not found")
     
+    cctv_id = query.cctv_connection.id
     query.delete()
+    invalidate_calibrations([cctv_id])
+    background_tasks.add_task(push_calibrations)
 
     response = get_response_format(200, message = f"calibration with id of {id} has been deleted")
 
@@ -394,39 +947,67 @@ def delete_calibration(id: int):
 
 @router.delete("/calibration/type/{id}", response_model = ResponseAPI, response_model_exclude_none = True)
 @db_session
-def delete_calibration_type(id: int):
+def delete_calibration_type(id: int, background_tasks: BackgroundTasks):
     query = GaugeType.get(id = id)
     if not query:
         raise HTTPException(status_code=404, detail="Item not found")
     
+    # its calibrations go with it
+    cctv_ids = [cal.cctv_connection.id for cal in query.calibrations]
     query.delete()
+    invalidate_calibrations(cctv_ids)
+    background_tasks.add_task(push_calibrations)
     response = get_response_format(200, message = f"calibration type with id of {id} has been deleted")
 
     return response 
 
 @router.delete("/calibration/cctv/{id}", response_model = ResponseAPI, response_model_exclude_none = True)
 @db_session
-def delete_calibration_cctv(id: int):
+def delete_calibration_cctv(id: int, background_tasks: BackgroundTasks):
     query = CctvConnection.get(id = id)
     if not query:
         raise HTTPException(status_code=404, detail="Item not found")
     
     query.delete()
+    invalidate_calibrations([id])
+    background_tasks.add_task(push_calibrations)
     response = get_response_format(200, message = f"CCTV data with id of {id} has been deleted")
 
     return response 
 
+#-- METRICS endpoints
+
+@app.get("/metrics", include_in_schema = False)
+async def get_metrics():
+    body = app_metrics.render() + camera_registry(await call_streams("metrics")).render()
+
+    return Response(content = body, media_type = CONTENT_TYPE)
+
 #-- AUTH endpoints
 
 @app.post("/auth/login", response_model = ResponseAPI, response_model_exclude_none = True)
-@db_session
-def login(response: Response, req: LoginRequest):
-    user = User.get(email=req.email)
-    if not user or not user.verify_password(req.password):
+async def login(response: Response, req: LoginRequest):
+    key         = req.email.lower()
+    retry_after = login_limiter.retry_after(key)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many failed logins, try again later", headers={"Retry-After": str(math.ceil(retry_after))})
+
+    user = await run_in_threadpool(find_login, req.email)
+    try:
+        valid, rehashed = await password_executor.verify(req.password, user["password"]) if user else (False, None)
+    except PasswordBusy:
+        raise HTTPException(status_code=503, detail="Too many logins in progress, try again shortly", headers={"Retry-After": "1"})
+
+    if not valid:
+        login_limiter.record(key)
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    login_limiter.reset(key)
+    if rehashed:
+        await run_in_threadpool(update_password_hash, user["id"], rehashed)
+
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    token_data = {"sub": str(user.id), "exp": expire}
+    token_data = {"sub": str(user["id"]), "exp": expire}
     token = jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
 
     response.set_cookie(
@@ -442,7 +1023,15 @@ def login(response: Response, req: LoginRequest):
     return response
 
 @router.post("/auth/logout", response_model = ResponseAPI, response_model_exclude_none = True)
-def logout(response: Response):
+def logout(request: Request, response: Response):
+    # the cookie is gone from this browser, a copy of the token must not keep working until it expires
+    token = request.cookies.get("access_token")
+
+    # kept only as long as the token itself would have been accepted
+    ttl = token_ttl(jwt.get_unverified_claims(token))
+    revoked_tokens.add(token, ttl if ttl is not None else float(ACCESS_TOKEN_EXPIRE_MINUTES) * 60)
+    auth_cache.pop(token)
+
     response.delete_cookie(
         key="access_token",
         httponly=True,
@@ -0,0 +1,158 @@
+import grpc
+import time
+import bisect
+import hashlib
+import threading
+
+from channels import ChannelPool, channel_options
+
+FAILOVER_CODES = (
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+)
+
+def parse_targets(value: str):
+    return [target.strip() for target in str(value).split(",") if target.strip()]
+
+def ring_hash(key: str):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+def error_code(error):
+    # grpc.aio errors are RpcErrors with a code() but are not grpc.Call instances
+    if isinstance(error, grpc.RpcError) and callable(getattr(error, "code", None)):
+        return error.code()
+
+    return None
+
+def is_failover_error(error):
+    if isinstance(error, TimeoutError):
+        return True
+
+    return error_code(error) in FAILOVER_CODES
+
+class Backend:
+    def __init__(self, target: str, pool: ChannelPool, inflight: int = 64, max_failures: int = 3, cooldown: float = 10.0):
+        self.target       = target
+        self.pool         = pool
+        self.limit        = inflight
+        self.inflight     = threading.BoundedSemaphore(inflight)
+        self.max_failures = max_failures
+        self.cooldown     = cooldown
+        self.failures     = 0
+        self.drained_at   = None
+        self.retry_at     = 0.0
+        self.active       = 0
+        self.lock         = threading.Lock()
+
+    def healthy(self):
+        return time.monotonic() >= self.retry_at
+
+    def stub(self, camera_id: str, track: bool = True):
+        return self.pool.stub(camera_id, track)
+
+    def acquire(self, timeout: float = None):
+        if not self.inflight.acquire(timeout = timeout):
+            raise TimeoutError(f"backend {self.target} has {self.limit} frames in flight")
+
+        with self.lock:
+            self.active += 1
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+        self.inflight.release()
+
+    def succeeded(self):
+        if self.failures:
+            with self.lock:
+                self.failures = 0
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.max_failures:
+                return False
+
+            if self.healthy():
+                print(f"grpc backend {self.target} is failing, draining its cameras for {self.cooldown}s")
+
+            self.drained_at = time.time()
+            self.retry_at   = time.monotonic() + self.cooldown
+            self.failures   = 0
+
+            return True
+
+    def status(self):
+        return {
+            "target"     : self.target,
+            "healthy"    : self.healthy(),
+            "inflight"   : self.active,
+            "limit"      : self.limit,
+            "drained_at" : self.drained_at,
+            "channels"   : self.pool.status(),
+        }
+
+    def close(self):
+        self.pool.close()
+
+class BackendRouter:
+    def __init__(self, backends, replicas: int = 100):
+        self.backends = list(backends)
+        self.ring     = sorted(
+            (ring_hash(f"{backend.target}#{i}"), index)
+            for index, backend in enumerate(self.backends)
+            for i in range(replicas)
+        )
+        self.keys     = [key for key, _ in self.ring]
+
+    def candidates(self, camera_id: str):
+        seen  = []
+        start = bisect.bisect(self.keys, ring_hash(camera_id))
+
+        for offset in range(len(self.ring)):
+            _, index = self.ring[(start + offset) % len(self.ring)]
+            if index not in seen:
+                seen.append(index)
+                if len(seen) == len(self.backends):
+                    break
+
+        return [self.backends[index] for index in seen]
+
+    def route(self, camera_id: str):
+        candidates = self.candidates(camera_id)
+        for backend in candidates:
+            if backend.healthy():
+                return backend
+
+        return candidates[0]
+
+    def status(self):
+        return [backend.status() for backend in self.backends]
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+def create_router(
+    targets,
+    pool_size: int = 4,
+    keepalive_ms: int = 30000,
+    max_message_mb: int = 16,
+    compression: str = "none",
+    inflight: int = 64,
+    max_failures: int = 3,
+    cooldown: float = 10.0,
+):
+    backends = []
+    for target in targets:
+        pool = ChannelPool(
+            target,
+            size        = pool_size,
+            options     = channel_options(keepalive_ms, max_message_mb),
+            compression = compression
+        )
+        backends.append(Backend(target, pool, inflight = inflight, max_failures = max_failures, cooldown = cooldown))
+
+    return BackendRouter(backends)
@@ -0,0 +1,181 @@
+import grpc
+import time
+import threading
+import collections
+import frame_pb2
+
+from concurrent.futures import Future
+
+def percentile(values, pct: float):
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    index   = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+
+    return ordered[index]
+
+class PendingFrame:
+    __slots__ = ("message", "future", "enqueued_at")
+
+    def __init__(self, message):
+        self.message     = message
+        self.future      = Future()
+        self.enqueued_at = time.monotonic()
+
+class FrameBatcher:
+    def __init__(self, backend, max_size: int = 16, max_wait: float = 0.02, timeout: float = 5.0):
+        self.backend     = backend
+        self.max_size    = max(1, max_size)
+        self.max_wait    = max_wait
+        self.timeout     = timeout
+        self.stub        = backend.stub("batch", track = False)
+        self.pending     = collections.deque()
+        self.cond        = threading.Condition()
+        self.closed      = False
+        self.unary       = False
+        self.batches     = 0
+        self.frames      = 0
+        self.latencies   = collections.deque(maxlen = 1024)
+        self.thread      = threading.Thread(target = self._run, name = f"batch-{backend.target}", daemon = True)
+        self.thread.start()
+
+    def submit(self, message):
+        pending = PendingFrame(message)
+
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("frame batcher has been closed")
+
+            self.pending.append(pending)
+            self.cond.notify()
+
+        return pending.future
+
+    def _take(self):
+        with self.cond:
+            while not self.pending and not self.closed:
+                self.cond.wait()
+
+            if not self.pending:
+                return None
+
+            deadline = self.pending[0].enqueued_at + self.max_wait
+            while len(self.pending) < self.max_size and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            count = min(self.max_size, len(self.pending))
+
+            return [self.pending.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+
+            # the thread serves every camera of the backend, one bad batch must not stop it
+            try:
+                self._flush(batch)
+            except Exception as e:
+                print(f"unable to send a batch of {len(batch)} frames to {self.backend.target}: {e}")
+                self._fail(batch, e)
+
+    def _fail(self, batch, error):
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+
+    def _flush(self, batch):
+        # frames that queued past the timeout are failed instead of being sent late
+        now     = time.monotonic()
+        expired = [pending for pending in batch if now - pending.enqueued_at > self.timeout]
+        if expired:
+            self._fail(expired, TimeoutError(f"frame waited more than {self.timeout}s for a batch"))
+            batch = [pending for pending in batch if now - pending.enqueued_at <= self.timeout]
+            if not batch:
+                return
+
+        try:
+            if self.unary:
+                for pending in batch:
+                    self.stub.SendFrame(pending.message, timeout = self.timeout)
+            else:
+                self.stub.SendFrameBatch(frame_pb2.FrameBatch(frames = [p.message for p in batch]), timeout = self.timeout)
+        except grpc.RpcError as e:
+            if isinstance(e, grpc.Call) and e.code() == grpc.StatusCode.UNIMPLEMENTED and not self.unary:
+                print("grpc server does not implement SendFrameBatch, falling back to unary SendFrame")
+                self.unary = True
+                self._flush(batch)
+                return
+
+            self._fail(batch, e)
+            return
+
+        done = time.monotonic()
+        self.batches += 1
+        self.frames  += len(batch)
+
+        for pending in batch:
+            self.latencies.append(done - pending.enqueued_at)
+            pending.future.set_result(True)
+
+    def status(self):
+        latencies = list(self.latencies)
+        p50       = percentile(latencies, 50)
+        p99       = percentile(latencies, 99)
+
+        return {
+            "batches"    : self.batches,
+            "frames"     : self.frames,
+            "fill_ratio" : round(self.frames / (self.batches * self.max_size), 4) if self.batches else 0.0,
+            "p50_ms"     : round(p50 * 1000, 2) if p50 is not None else None,
+            "p99_ms"     : round(p99 * 1000, 2) if p99 is not None else None,
+        }
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+        self.thread.join(self.timeout)
+
+        # frames the thread did not get to before the join gave up are failed, not left waiting
+        with self.cond:
+            batch = list(self.pending)
+            self.pending.clear()
+
+        self._fail(batch, RuntimeError("frame batcher has been closed"))
+
+class BatchDispatcher:
+    def __init__(self, max_size: int = 16, max_wait: float = 0.02, timeout: float = 5.0):
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.timeout  = timeout
+        self.batchers = {}
+        self.lock     = threading.Lock()
+
+    def batcher(self, backend):
+        with self.lock:
+            batcher = self.batchers.get(backend.target)
+            if batcher is None:
+                batcher = FrameBatcher(backend, self.max_size, self.max_wait, self.timeout)
+                self.batchers[backend.target] = batcher
+
+        return batcher
+
+    def status(self, target: str):
+        batcher = self.batchers.get(target)
+
+        return batcher.status() if batcher is not None else None
+
+    def close(self):
+        with self.lock:
+            batchers = list(self.batchers.values())
+            self.batchers.clear()
+
+        for batcher in batchers:
+            batcher.close()
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app as service
+
+from ttlcache import TTLCache
+
+async def login(client, email, password):
+    response = await client.post("/auth/login", json = {"email": email, "password": password})
+    if response.status_code != 200:
+        raise SystemExit(f"login failed with {response.status_code}: {response.text}")
+
+    return response.json()["data"]
+
+async def load(client, path, requests, concurrency):
+    remaining = iter(range(requests))
+    failures  = 0
+
+    async def worker():
+        nonlocal failures
+        for _ in remaining:
+            response = await client.get(path)
+            if response.status_code != 200:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return requests / (time.perf_counter() - start), failures
+
+async def run(args):
+    transport = httpx.ASGITransport(app = service.app)
+    async with httpx.AsyncClient(transport = transport, base_url = "http://bench") as client:
+        token = await login(client, args.email, args.password)
+        client.cookies.set("access_token", token)
+
+        print(f"{'auth cache':<12} {'req/s':>10} {'failed':>8}")
+        for label, size in (("off", 0), ("on", args.cache_size)):
+            service.auth_cache = TTLCache(size, args.cache_ttl)
+
+            await load(client, args.path, args.warmup, args.concurrency)
+            rate, failures = await load(client, args.path, args.requests, args.concurrency)
+            print(f"{label:<12} {rate:>10.1f} {failures:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description = "throughput of an authenticated endpoint with and without the token cache")
+    parser.add_argument("--path", default = "/status")
+    parser.add_argument("--requests", type = int, default = 2000)
+    parser.add_argument("--warmup", type = int, default = 100)
+    parser.add_argument("--concurrency", type = int, default = 16)
+    parser.add_argument("--cache-size", type = int, default = 1024)
+    parser.add_argument("--cache-ttl", type = float, default = 60)
+    parser.add_argument("--email", default = "admin@admin.com")
+    parser.add_argument("--password", default = "adminadmin")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import frame_pb2
+
+from sender import FrameSender
+from stand_in_server import serve, client_router
+
+def run_camera(router, mode, camera_id, payload, stop, counters):
+    sender  = FrameSender(router, camera_id, mode = mode, timeout = 1.0)
+    message = frame_pb2.Frame(camera_id = camera_id, width = 1920, height = 1080, data = payload)
+
+    while not stop.is_set():
+        try:
+            sender.send(message)
+        except Exception:
+            counters["failed"] += 1
+            time.sleep(0.05)
+
+    sender.close()
+
+def snapshot(servicers):
+    return [servicer.received for servicer in servicers]
+
+def main():
+    parser = argparse.ArgumentParser(description = "fan frames out over several stand-in FrameService backends and fail one over")
+    parser.add_argument("--backends", type = int, default = 3)
+    parser.add_argument("--cameras", type = int, default = 24)
+    parser.add_argument("--seconds", type = float, default = 3.0)
+    parser.add_argument("--payload-kb", type = int, default = 200)
+    parser.add_argument("--inflight", type = int, default = 16)
+    parser.add_argument("--mode", default = "stream")
+    args = parser.parse_args()
+
+    servers   = [serve() for _ in range(args.backends)]
+    targets   = [target for _, _, target in servers]
+    servicers = [servicer for _, servicer, _ in servers]
+    router    = client_router(targets, inflight = args.inflight, cooldown = args.seconds * 10)
+    payload   = os.urandom(args.payload_kb * 1024)
+    stop      = threading.Event()
+    counters  = {"failed": 0}
+
+    owners = {}
+    for i in range(args.cameras):
+        owners.setdefault(router.route(f"cam-{i}").target, []).append(f"cam-{i}")
+
+    for target in targets:
+        print(f"{target}: {len(owners.get(target, []))} cameras")
+
+    threads = [
+        threading.Thread(target = run_camera, args = (router, args.mode, f"cam-{i}", payload, stop, counters))
+        for i in range(args.cameras)
+    ]
+    for t in threads:
+        t.start()
+
+    time.sleep(args.seconds)
+    before = snapshot(servicers)
+    print(f"healthy phase   frames per backend: {before}")
+
+    servers[0][0].stop(grace = None)
+    print(f"stopped backend {targets[0]}")
+
+    time.sleep(args.seconds)
+    after = snapshot(servicers)
+    print(f"failover phase  frames per backend: {[a - b for a, b in zip(after, before)]}")
+
+    stop.set()
+    for t in threads:
+        t.join()
+
+    for backend in router.status():
+        print(f"{backend['target']}: healthy={backend['healthy']} inflight={backend['inflight']} drained_at={backend['drained_at']}")
+
+    print(f"failed sends: {counters['failed']}")
+
+    router.close()
+    for server, _, _ in servers[1:]:
+        server.stop(grace = None)
+
+if __name__ == "__main__":
+    main()
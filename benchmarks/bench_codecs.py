@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from capture import open_capture, is_keyframe
+from encoder import create_encoder
+from bench_encode import RESOLUTIONS, synthetic_frame
+
+CODECS = {
+    "jpeg"          : {"name": "jpeg"},
+    "jpeg-optimize" : {"name": "jpeg", "optimize": True},
+    "jpeg-420"      : {"name": "jpeg", "subsampling": "420"},
+    "webp"          : {"name": "webp"},
+    "png-gray"      : {"name": "png-gray"},
+    "raw"           : {"name": "raw"},
+}
+
+def measure(encoder, frame, iterations):
+    size  = len(encoder.encode("bench", frame).data)
+    start = time.process_time()
+    for _ in range(iterations):
+        encoder.encode("bench", frame)
+
+    return (time.process_time() - start) / iterations, size
+
+def measure_passthrough(video, limit):
+    encoder = create_encoder("passthrough")
+    cap     = open_capture(video, raw = True)
+    if not cap.isOpened():
+        raise SystemExit(f"unable to open {video}")
+    encoder.configure(cap)
+
+    sizes = []
+    start = time.process_time()
+    while len(sizes) < limit:
+        ret, packet = cap.read()
+        if not ret:
+            break
+        sizes.append(len(encoder.encode("bench", packet, keyframe = is_keyframe(cap)).data))
+    cpu = time.process_time() - start
+    cap.release()
+
+    if not sizes:
+        raise SystemExit(f"no packets read from {video}")
+
+    return encoder, cpu / len(sizes), sum(sizes) / len(sizes)
+
+def main():
+    parser = argparse.ArgumentParser(description = "per-frame CPU time and payload size of each codec")
+    parser.add_argument("--iterations", type = int, default = 20)
+    parser.add_argument("--quality", type = int, default = 80)
+    parser.add_argument("--video", help = "file or rtsp url whose packets are measured for passthrough")
+    parser.add_argument("--packets", type = int, default = 250)
+    args = parser.parse_args()
+
+    print(f"{'resolution':<10} {'codec':<14} {'cpu ms':>9} {'KiB/frame':>10}")
+    for name, (width, height) in RESOLUTIONS.items():
+        frame = synthetic_frame(width, height)
+        for label, options in CODECS.items():
+            options = dict(options)
+            encoder = create_encoder(options.pop("name"), args.quality, **options)
+            cpu, size = measure(encoder, frame, args.iterations)
+            print(f"{name:<10} {label:<14} {cpu * 1000:>9.2f} {size / 1024:>10.1f}")
+
+    if args.video:
+        encoder, cpu, size = measure_passthrough(args.video, args.packets)
+        label = f"{encoder.width}x{encoder.height}"
+        print(f"{label:<10} {'pass-' + encoder.codec:<14} {cpu * 1000:>9.2f} {size / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import cv2
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from capture import open_capture
+
+CONFIGURATIONS = [
+    {"name": "read",              "grab": False, "options": None},
+    {"name": "read threads=1",    "grab": False, "options": "threads;1"},
+    {"name": "grab+retrieve",     "grab": True,  "options": None},
+    {"name": "grab+retrieve t=1", "grab": True,  "options": "threads;1"},
+]
+
+def synthetic_source(path, frames, width, height, fps):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for i in range(frames):
+        frame = np.full((height, width, 3), i % 255, np.uint8)
+        cv2.circle(frame, (width // 2, height // 2), height // 4 + i % 50, (0, 0, 255), 5)
+        writer.write(frame)
+    writer.release()
+
+def run(source, config, transport, retrieve_every):
+    cap = open_capture(source, transport, config["options"])
+    if not cap.isOpened():
+        raise RuntimeError(f"unable to open {source}")
+
+    frames = 0
+    start  = time.process_time()
+    while True:
+        if config["grab"]:
+            ok = cap.grab()
+            if ok and frames % retrieve_every == 0:
+                ok, _ = cap.retrieve()
+        else:
+            ok, _ = cap.read()
+
+        if not ok:
+            break
+        frames += 1
+
+    cpu = time.process_time() - start
+    cap.release()
+
+    return frames, cpu
+
+def main():
+    parser = argparse.ArgumentParser(description = "decode CPU per capture configuration")
+    parser.add_argument("--source", help = "video file or rtsp url, a synthetic mp4 is generated when omitted")
+    parser.add_argument("--transport", choices = ("tcp", "udp"))
+    parser.add_argument("--frames", type = int, default = 500)
+    parser.add_argument("--width", type = int, default = 1920)
+    parser.add_argument("--height", type = int, default = 1080)
+    parser.add_argument("--fps", type = int, default = 25)
+    parser.add_argument("--target-fps", type = float, default = 1.0, help = "rate at which grab mode retrieves a frame")
+    args = parser.parse_args()
+
+    source = args.source
+    if source is None:
+        source = os.path.join(tempfile.mkdtemp(), "source.mp4")
+        synthetic_source(source, args.frames, args.width, args.height, args.fps)
+
+    retrieve_every = max(1, int(round(args.fps / args.target_fps)))
+
+    print(f"{'configuration':<20} {'frames':>7} {'cpu s':>8} {'cpu ms/frame':>13}")
+    for config in CONFIGURATIONS:
+        frames, cpu = run(source, config, args.transport, retrieve_every)
+        per_frame   = cpu / frames * 1000 if frames else 0.0
+        print(f"{config['name']:<20} {frames:>7} {cpu:>8.2f} {per_frame:>13.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import io
+import os
+import sys
+import cv2
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import frame_pb2
+
+from PIL import Image
+from encoder import JpegEncoder
+
+RESOLUTIONS = {
+    "720p"  : (1280, 720),
+    "1080p" : (1920, 1080),
+    "4k"    : (3840, 2160),
+}
+
+def synthetic_frame(width, height):
+    x     = np.linspace(0, 255, width, dtype = np.uint8)
+    frame = np.repeat(np.tile(x, (height, 1))[:, :, None], 3, axis = 2)
+    noise = np.random.default_rng(0).integers(0, 16, size = frame.shape, dtype = np.uint8)
+    frame = cv2.add(frame, noise)
+    cv2.circle(frame, (width // 2, height // 2), min(width, height) // 3, (0, 0, 255), 8)
+
+    return frame
+
+def legacy_encode(camera_id, frame):
+    _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+    frame_bytes = buffer.tobytes()
+
+    img = Image.open(io.BytesIO(frame_bytes))
+    w, h = img.size
+
+    return frame_pb2.Frame(camera_id = camera_id, width = w, height = h, data = frame_bytes)
+
+def measure(encode, frame, iterations):
+    encode("bench", frame)
+
+    start = time.process_time()
+    for _ in range(iterations):
+        encode("bench", frame)
+    cpu = (time.process_time() - start) / iterations
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(iterations):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        encode("bench", frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return cpu, sum(peaks) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description = "per-frame encode CPU time and allocations")
+    parser.add_argument("--iterations", type = int, default = 30)
+    parser.add_argument("--quality", type = int, default = 80)
+    args = parser.parse_args()
+
+    encoders = {
+        "legacy" : legacy_encode,
+        "jpeg"   : JpegEncoder(args.quality).encode,
+    }
+
+    print(f"{'resolution':<10} {'path':<8} {'cpu ms':>9} {'alloc KiB':>10}")
+    for name, (width, height) in RESOLUTIONS.items():
+        frame = synthetic_frame(width, height)
+        for label, encode in encoders.items():
+            cpu, alloc = measure(encode, frame, args.iterations)
+            print(f"{name:<10} {label:<8} {cpu * 1000:>9.2f} {alloc / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from batching import percentile
+from stand_in_server import serve
+
+def server_main(conn, delay, jitter, error_rate):
+    server, servicer, target = serve(delay = delay, jitter = jitter, error_rate = error_rate)
+    conn.send(target)
+
+    while True:
+        command, payload = conn.recv()
+        if command == "stop":
+            break
+
+        conn.send({
+            "received" : servicer.received,
+            "injected" : servicer.injected,
+            "gaps"     : servicer.gaps,
+            "arrivals" : servicer.window(payload),
+        })
+
+    server.stop(grace = None)
+
+def process_usage(pids):
+    cpu, rss = 0.0, 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/status") as f:
+                rss += next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+        except (FileNotFoundError, StopIteration):
+            continue
+
+        cpu += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    return cpu, rss
+
+def histogram_buckets(text: str, name: str = "lugh_send_seconds"):
+    buckets = {}
+    for line in text.splitlines():
+        if not line.startswith(name + "_bucket{"):
+            continue
+
+        labels, value = line.rsplit(" ", 1)
+        bound         = labels.split('le="', 1)[1].split('"', 1)[0]
+        bound         = float("inf") if bound == "+Inf" else float(bound)
+        buckets[bound] = buckets.get(bound, 0) + float(value)
+
+    return buckets
+
+def bucket_quantile(start: dict, end: dict, q: float):
+    cumulative = sorted((bound, count - start.get(bound, 0)) for bound, count in end.items())
+    if not cumulative or not cumulative[-1][1]:
+        return None
+
+    rank = q * cumulative[-1][1]
+    for bound, count in cumulative:
+        if count >= rank:
+            return bound
+
+    return cumulative[-1][0]
+
+def source_url(args, index: int):
+    if args.file:
+        return f"synthetic://load-{index}?file={quote(args.file)}&fps={args.fps}"
+
+    return f"synthetic://load-{index}?size={args.size}&fps={args.fps}"
+
+def snapshot(client, server, pids):
+    status   = client.get("/status").json()["data"] or []
+    cpu, rss = process_usage(pids + [camera["pid"] for camera in status if "pid" in camera])
+
+    return {
+        "at"      : time.time(),
+        "cpu"     : cpu,
+        "rss"     : rss,
+        "sent"    : sum(camera["sent"] for camera in status),
+        "failed"  : sum(camera["failed"] for camera in status),
+        "dropped" : sum(camera["dropped"] for camera in status),
+        "send"    : histogram_buckets(client.get("/metrics").text),
+        "server"  : server,
+    }
+
+def run(client, server, cameras: int, args):
+    camera_ids = [f"load-{i}" for i in range(cameras)]
+    for index, camera_id in enumerate(camera_ids):
+        response = client.post("/connect", json = {"camera_id": camera_id, "rtsp_url": source_url(args, index), "codec": args.codec})
+        if response.status_code != 200:
+            raise SystemExit(f"/connect failed with {response.status_code}: {response.text}")
+
+    time.sleep(args.warmup)
+
+    server.send(("window", time.time()))
+    before = snapshot(client, server.recv(), [os.getpid()])
+
+    time.sleep(args.duration)
+
+    server.send(("window", before["at"]))
+    after = snapshot(client, server.recv(), [os.getpid()])
+
+    client.post("/bulk/disconnect", json = {"camera_ids": camera_ids})
+
+    elapsed  = after["at"] - before["at"]
+    received = after["server"]["received"] - before["server"]["received"]
+    arrivals = [latency for _, arrived, latency in after["server"]["arrivals"] if latency is not None and arrived <= after["at"]]
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "cameras"          : cameras,
+        "fps"              : round(received / elapsed, 2),
+        "fps_per_camera"   : round(received / elapsed / cameras, 2),
+        "cpu_per_camera"   : round((after["cpu"] - before["cpu"]) / elapsed / cameras * 100, 2),
+        "rss_mib"          : round(after["rss"] / 1024 / 1024, 1),
+        "send_p50_ms"      : ms(bucket_quantile(before["send"], after["send"], 0.5)),
+        "send_p99_ms"      : ms(bucket_quantile(before["send"], after["send"], 0.99)),
+        "arrival_p50_ms"   : ms(percentile(arrivals, 50)),
+        "arrival_p99_ms"   : ms(percentile(arrivals, 99)),
+        "sent"             : after["sent"] - before["sent"],
+        "failed"           : after["failed"] - before["failed"],
+        "dropped"          : after["dropped"] - before["dropped"],
+        "injected"         : after["server"]["injected"] - before["server"]["injected"],
+        "gaps"             : after["server"]["gaps"] - before["server"]["gaps"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = "drive /connect of the real app with synthetic cameras against a stand-in FrameService")
+    parser.add_argument("--cameras", type = int, nargs = "+", default = [1, 4, 16])
+    parser.add_argument("--fps", type = float, default = 15)
+    parser.add_argument("--size", default = "1280x720")
+    parser.add_argument("--file", help = "local video decoded in a loop by every camera instead of drawn frames")
+    parser.add_argument("--codec", choices = ["jpeg", "webp", "png-gray", "raw", "passthrough"])
+    parser.add_argument("--warmup", type = float, default = 5)
+    parser.add_argument("--duration", type = float, default = 20)
+    parser.add_argument("--server-delay-ms", type = float, default = 0)
+    parser.add_argument("--server-jitter-ms", type = float, default = 0)
+    parser.add_argument("--error-rate", type = float, default = 0)
+    parser.add_argument("--send-mode", choices = ["stream", "unary", "batch"])
+    parser.add_argument("--runtime", choices = ["threads", "async"])
+    parser.add_argument("--workers", help = "STREAM_WORKERS for the app, a count or auto")
+    parser.add_argument("--json", help = "append one line per run to this file to track results over time")
+    parser.add_argument("--email", default = "admin@admin.com")
+    parser.add_argument("--password", default = "adminadmin")
+    args = parser.parse_args()
+
+    context      = multiprocessing.get_context("spawn")
+    conn, child  = context.Pipe()
+    server       = context.Process(target = server_main, args = (child, args.server_delay_ms / 1000, args.server_jitter_ms / 1000, args.error_rate), daemon = True)
+    server.start()
+
+    # the app reads its configuration when imported, values in a local .env still take precedence
+    os.environ["GRPC_ADDRESS"]           = conn.recv()
+    os.environ["STREAM_ALLOW_SYNTHETIC"] = "true"
+    for name, value in (("GRPC_SEND_MODE", args.send_mode), ("STREAM_RUNTIME", args.runtime), ("STREAM_WORKERS", args.workers)):
+        if value:
+            os.environ[name] = value
+
+    import app as service
+    from fastapi.testclient import TestClient
+
+    config = {key: value for key, value in vars(args).items() if key not in ("cameras", "json", "email", "password")}
+    print(f"{'cameras':>7} {'fps':>8} {'fps/cam':>8} {'cpu%/cam':>9} {'rss MiB':>8} {'send p50':>9} {'send p99':>9} {'arr p50':>8} {'arr p99':>8} {'failed':>7} {'dropped':>8}")
+
+    with TestClient(service.app) as client:
+        response = client.post("/auth/login", json = {"email": args.email, "password": args.password})
+        if response.status_code != 200:
+            raise SystemExit(f"login failed with {response.status_code}: {response.text}")
+
+        for cameras in args.cameras:
+            result = run(client, conn, cameras, args)
+            print(f"{result['cameras']:>7} {result['fps']:>8} {result['fps_per_camera']:>8} {result['cpu_per_camera']:>9} {result['rss_mib']:>8} "
+                  f"{result['send_p50_ms']!s:>9} {result['send_p99_ms']!s:>9} {result['arrival_p50_ms']!s:>8} {result['arrival_p99_ms']!s:>8} {result['failed']:>7} {result['dropped']:>8}")
+
+            if args.json:
+                with open(args.json, "a") as f:
+                    f.write(json.dumps({"at": time.time(), "config": config, **result}) + "\n")
+
+    conn.send(("stop", None))
+    server.join(5)
+
+if __name__ == "__main__":
+    main()
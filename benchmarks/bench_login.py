@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app as service
+
+from batching import percentile
+from passwords import PasswordExecutor
+from fastapi.concurrency import run_in_threadpool
+
+class ThreadpoolVerifier(PasswordExecutor):
+    # the old behaviour, argon2 on the same threadpool that serves the sync endpoints
+    async def verify(self, password, hash):
+        return await run_in_threadpool(self._verify, password, hash)
+
+async def logins(client, count, concurrency, email, password):
+    remaining = iter(range(count))
+    statuses  = {}
+
+    async def worker():
+        for _ in remaining:
+            response = await client.post("/auth/login", json = {"email": email, "password": password})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return statuses
+
+async def probe(client, path, token, done, interval):
+    latencies = []
+    while not done.is_set():
+        start = time.perf_counter()
+        await client.get(path, cookies = {"access_token": token})
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+    return latencies
+
+async def run_case(client, executor, token, args):
+    service.password_executor = executor
+
+    done   = asyncio.Event()
+    prober = asyncio.create_task(probe(client, args.path, token, done, args.interval))
+    start  = time.perf_counter()
+
+    statuses = await logins(client, args.logins, args.concurrency, args.email, args.password)
+    elapsed  = time.perf_counter() - start
+
+    done.set()
+    latencies = await prober
+    executor.shutdown()
+
+    return args.logins / elapsed, statuses, latencies
+
+async def run(args):
+    transport = httpx.ASGITransport(app = service.app)
+    async with httpx.AsyncClient(transport = transport, base_url = "http://bench") as client:
+        response = await client.post("/auth/login", json = {"email": args.email, "password": args.password})
+        token    = response.json()["data"]
+
+        cases = [("threadpool", ThreadpoolVerifier(service.password_hasher, 1, args.logins))]
+        for threads in args.threads:
+            cases.append((f"executor-{threads}", PasswordExecutor(service.password_hasher, threads, args.logins)))
+
+        print(f"{'hashing':<14} {'logins/s':>9} {'probe p50 ms':>13} {'probe p99 ms':>13} {'probes':>7}  statuses")
+        for label, executor in cases:
+            rate, statuses, latencies = await run_case(client, executor, token, args)
+            p50 = percentile(latencies, 50) * 1000 if latencies else 0
+            p99 = percentile(latencies, 99) * 1000 if latencies else 0
+            print(f"{label:<14} {rate:>9.1f} {p50:>13.1f} {p99:>13.1f} {len(latencies):>7}  {statuses}")
+
+def main():
+    parser = argparse.ArgumentParser(description = "concurrent logins and the latency they add to a protected endpoint")
+    parser.add_argument("--path", default = "/calibration/type")
+    parser.add_argument("--logins", type = int, default = 64)
+    parser.add_argument("--concurrency", type = int, default = 32)
+    parser.add_argument("--threads", type = int, nargs = "+", default = [1, 2, 4])
+    parser.add_argument("--interval", type = float, default = 0.01)
+    parser.add_argument("--email", default = "admin@admin.com")
+    parser.add_argument("--password", default = "adminadmin")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import argparse
+import functools
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import frame_pb2
+
+from sender import FrameSender, SEND_MODE_STREAM, SEND_MODE_UNARY, SEND_MODE_BATCH
+from batching import BatchDispatcher, percentile
+from stand_in_server import serve, client_router
+
+def run_camera(router, mode, camera_id, frames, payload, latencies, dispatcher):
+    sender  = FrameSender(router, camera_id, mode = mode, dispatcher = dispatcher)
+    message = frame_pb2.Frame(camera_id = camera_id, width = 1920, height = 1080, data = payload)
+
+    # every mode is timed from the send to the server's ack, streaming keeps its window of frames in flight
+    def acked(start, error):
+        if error is None:
+            latencies.append(time.perf_counter() - start)
+
+    for _ in range(frames):
+        sender.send(message, functools.partial(acked, time.perf_counter()))
+
+    sender.close()
+
+def run(mode, cameras, frames, payload, delay, batch_size, batch_wait):
+    server, servicer, target = serve(delay = delay)
+    router     = client_router([target])
+    dispatcher = BatchDispatcher(batch_size, batch_wait) if mode == SEND_MODE_BATCH else None
+    latencies  = []
+    threads    = [
+        threading.Thread(target = run_camera, args = (router, mode, f"cam-{i}", frames, payload, latencies, dispatcher))
+        for i in range(cameras)
+    ]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    fill = dispatcher.status(target)["fill_ratio"] if dispatcher is not None else None
+    if dispatcher is not None:
+        dispatcher.close()
+
+    router.close()
+    server.stop(grace = None)
+
+    return {
+        "mode"     : mode,
+        "frames"   : servicer.received,
+        "fps"      : servicer.received / elapsed,
+        "p50_ms"   : percentile(latencies, 50) * 1000,
+        "p99_ms"   : percentile(latencies, 99) * 1000,
+        "fill"     : fill,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = "compare unary SendFrame, acknowledged StreamFramesAcked and batched SendFrameBatch")
+    parser.add_argument("--cameras", type = int, default = 8)
+    parser.add_argument("--frames", type = int, default = 500)
+    parser.add_argument("--payload-kb", type = int, default = 200)
+    parser.add_argument("--server-delay-ms", type = float, default = 0.0)
+    parser.add_argument("--batch-size", type = int, default = 8)
+    parser.add_argument("--batch-wait-ms", type = float, default = 20.0)
+    args = parser.parse_args()
+
+    payload = os.urandom(args.payload_kb * 1024)
+    delay   = args.server_delay_ms / 1000
+
+    print(f"{'mode':<8} {'frames':>8} {'fps':>10} {'p50 ack ms':>11} {'p99 ack ms':>11} {'fill':>6}")
+    for mode in (SEND_MODE_UNARY, SEND_MODE_STREAM, SEND_MODE_BATCH):
+        result = run(mode, args.cameras, args.frames, payload, delay, args.batch_size, args.batch_wait_ms / 1000)
+        fill   = f"{result['fill']:.2f}" if result["fill"] is not None else "-"
+        print(f"{result['mode']:<8} {result['frames']:>8} {result['fps']:>10.1f} {result['p50_ms']:>11.2f} {result['p99_ms']:>11.2f} {fill:>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from encoder import RawEncoder
+from sender import FrameSender, SEND_MODE_STREAM
+from sharedmem import SharedRing
+from stand_in_server import serve, client_router
+
+PAYLOADS = {
+    "jpeg-200k" : lambda: np.random.default_rng(0).integers(0, 256, size = (1, 200 * 1024), dtype = np.uint8),
+    "raw-720p"  : lambda: np.zeros((720, 1280, 3), dtype = np.uint8),
+    "raw-1080p" : lambda: np.zeros((1080, 1920, 3), dtype = np.uint8),
+}
+
+def consumer_main(conn):
+    server, servicer, target = serve()
+    conn.send(target)
+    conn.recv()
+    conn.send((servicer.received, servicer.missed, servicer.bytes))
+    server.stop(grace = None)
+
+def run(transport, payload, frames, mode, slots):
+    parent, child = multiprocessing.Pipe()
+    consumer      = multiprocessing.Process(target = consumer_main, args = (child,), daemon = True)
+    consumer.start()
+    target = parent.recv()
+
+    router  = client_router([target])
+    sender  = FrameSender(router, "bench", mode = mode)
+    encoder = RawEncoder()
+    ring    = SharedRing("bench", slots = slots, slot_size = payload.nbytes) if transport == "shm" else None
+
+    start = time.perf_counter()
+    cpu   = time.process_time()
+    for sequence in range(frames):
+        sender.send(encoder.encode("bench", payload, sequence = sequence, ring = ring))
+    sender.close()
+    elapsed = time.perf_counter() - start
+    cpu     = time.process_time() - cpu
+
+    parent.send("report")
+    received, missed, size = parent.recv()
+    consumer.join()
+
+    fallback = "-"
+    if ring is not None:
+        fallback = ring.busy + ring.overflows
+        ring.close()
+    router.close()
+
+    return {
+        "fps"      : received / elapsed,
+        "cpu_ms"   : cpu / frames * 1000,
+        "received" : received,
+        "missed"   : missed,
+        "mib_s"    : size / elapsed / 1024 / 1024,
+        "fallback" : fallback,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = "compare inline grpc payloads with the shared-memory ring transport")
+    parser.add_argument("--frames", type = int, default = 300)
+    parser.add_argument("--slots", type = int, default = 16)
+    args = parser.parse_args()
+
+    print(f"{'payload':<10} {'transport':<9} {'fps':>9} {'MiB/s':>9} {'cpu ms':>8} {'received':>9} {'missed':>7} {'inline':>7}")
+    for name, create in PAYLOADS.items():
+        payload = create()
+        for transport in ("inline", "shm"):
+            result = run(transport, payload, args.frames, SEND_MODE_STREAM, args.slots)
+            print(f"{name:<10} {transport:<9} {result['fps']:>9.1f} {result['mib_s']:>9.1f} {result['cpu_ms']:>8.2f} {result['received']:>9} {result['missed']:>7} {result['fallback']:>7}")
+
+if __name__ == "__main__":
+    main()
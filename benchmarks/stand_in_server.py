@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import grpc
+import random
+import threading
+import collections
+
+from concurrent import futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import frame_pb2
+import frame_pb2_grpc
+
+from channels import ChannelPool
+from backends import Backend, BackendRouter
+from sharedmem import SharedRingReader
+
+# arrival records kept for percentiles, older ones are dropped so a long run stays bounded
+ARRIVALS = 200_000
+
+class InjectedError(Exception):
+    pass
+
+class StandInFrameService(frame_pb2_grpc.FrameServiceServicer):
+    def __init__(self, delay: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_code = grpc.StatusCode.UNAVAILABLE):
+        self.delay      = delay
+        self.jitter     = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.lock       = threading.Lock()
+        self.arrivals   = collections.deque(maxlen = ARRIVALS)
+        self.injected   = 0
+        self.received   = 0
+        self.bytes      = 0
+        self.gaps       = 0
+        self.reorders   = 0
+        self.missed     = 0
+        self.last       = {}
+        self.reader     = SharedRingReader()
+
+    def _record(self, request):
+        delay = self.delay + random.uniform(0, self.jitter) if self.jitter else self.delay
+        if delay:
+            time.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            with self.lock:
+                self.injected += 1
+            raise InjectedError("injected error")
+
+        arrived = time.time()
+        with self.lock:
+            data = request.data
+            if request.HasField("shared"):
+                data = self.reader.read(request.shared)
+                if data is None:
+                    self.missed += 1
+                    return
+
+            self.received += 1
+            self.bytes    += len(data)
+            self.arrivals.append((request.camera_id, arrived, arrived - request.captured_at_us / 1_000_000 if request.captured_at_us else None))
+
+            key  = (request.camera_id, request.calibration_id)
+            last = self.last.get(key)
+            if last is not None and request.sequence:
+                if request.sequence <= last:
+                    self.reorders += 1
+                    return
+                if request.sequence > last + 1:
+                    self.gaps += 1
+
+            self.last[key] = request.sequence
+
+    def SendFrame(self, request, context):
+        try:
+            self._record(request)
+        except InjectedError as e:
+            context.abort(self.error_code, str(e))
+
+        return frame_pb2.Empty()
+
+    def StreamFramesAcked(self, request_iterator, context):
+        try:
+            for request in request_iterator:
+                self._record(request)
+                yield frame_pb2.Ack(sequence = request.sequence, calibration_id = request.calibration_id)
+        except InjectedError as e:
+            # a failure ends the whole stream, the client opens a new one
+            context.abort(self.error_code, str(e))
+
+    def SendFrameBatch(self, request, context):
+        try:
+            for frame in request.frames:
+                self._record(frame)
+        except InjectedError as e:
+            context.abort(self.error_code, str(e))
+
+        return frame_pb2.Summary(frames_received = len(request.frames))
+
+    def window(self, since: float):
+        with self.lock:
+            return [arrival for arrival in self.arrivals if arrival[1] >= since]
+
+def serve(address: str = "127.0.0.1:0", delay: float = 0.0, workers: int = 64, jitter: float = 0.0, error_rate: float = 0.0):
+    servicer = StandInFrameService(delay = delay, jitter = jitter, error_rate = error_rate)
+    server   = grpc.server(
+        futures.ThreadPoolExecutor(max_workers = workers),
+        options = [
+            ("grpc.max_receive_message_length", 64 * 1024 * 1024),
+        ],
+    )
+    frame_pb2_grpc.add_FrameServiceServicer_to_server(servicer, server)
+
+    port = server.add_insecure_port(address)
+    server.start()
+
+    return server, servicer, f"127.0.0.1:{port}"
+
+def client_router(targets, pool_size: int = 1, inflight: int = 64, cooldown: float = 10.0):
+    return BackendRouter([
+        Backend(target, ChannelPool(target, size = pool_size), inflight = inflight, cooldown = cooldown)
+        for target in targets
+    ])
+
+if __name__ == "__main__":
+    address = sys.argv[1] if len(sys.argv) > 1 else "0.0.0.0:8501"
+    server, _, target = serve(address)
+    print(f"stand-in FrameService listening on {target}")
+    server.wait_for_termination()
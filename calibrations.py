@@ -0,0 +1,50 @@
+import threading
+
+from capture import redact_url
+
+class CalibrationCache:
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.version = 0
+        self.cameras = {}
+        self.urls    = {}
+
+    def _index(self):
+        # like the query it replaces, the lowest cctv id wins when several share a url
+        # credentials are stripped, autostart connects with the cctv user and password injected into the url
+        self.urls = {}
+        for cctv_id in sorted(self.cameras):
+            self.urls.setdefault(redact_url(self.cameras[cctv_id]["url"]), cctv_id)
+
+    def load(self, cameras: dict):
+        with self.lock:
+            self.version += 1
+            self.cameras  = {cctv_id: dict(camera, version = self.version) for cctv_id, camera in cameras.items()}
+            self._index()
+
+    def update(self, cctv_id: int, camera: dict = None):
+        with self.lock:
+            self.version += 1
+            self.cameras.pop(cctv_id, None)
+            if camera is not None:
+                self.cameras[cctv_id] = dict(camera, version = self.version)
+            self._index()
+
+    def lookup(self, cctv_id: int, rtsp_url: str):
+        with self.lock:
+            # a camera id is free text picked by the client, only an explicit cctv id skips the url match
+            if cctv_id is None:
+                cctv_id = self.urls.get(redact_url(rtsp_url))
+            camera  = self.cameras.get(cctv_id)
+            if camera is None:
+                return None, 0, []
+
+            return cctv_id, camera["version"], camera["calibrations"]
+
+    def status(self):
+        with self.lock:
+            return {
+                "version"      : self.version,
+                "cameras"      : len(self.cameras),
+                "calibrations" : sum(len(camera["calibrations"]) for camera in self.cameras.values()),
+            }
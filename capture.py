@@ -0,0 +1,191 @@
+import os
+import cv2
+import time
+import threading
+import numpy as np
+
+from urllib.parse import urlsplit, parse_qs
+
+FFMPEG_OPTIONS_ENV = "OPENCV_FFMPEG_CAPTURE_OPTIONS"
+RTSP_TRANSPORTS    = ("tcp", "udp")
+SYNTHETIC_SCHEME   = "synthetic"
+SYNTHETIC_MAX_FPS  = 120
+SYNTHETIC_MAX_SIZE = (3840, 2160)
+
+# OpenCV reads the FFmpeg options from the environment when a capture is opened
+open_lock = threading.Lock()
+
+def ffmpeg_options(transport: str = None, options: str = None):
+    pairs = []
+    if transport:
+        if transport not in RTSP_TRANSPORTS:
+            raise ValueError(f"unsupported rtsp transport {transport}")
+        pairs.append(f"rtsp_transport;{transport}")
+
+    if options:
+        pairs.extend(option.strip() for option in options.split("|") if option.strip())
+
+    return "|".join(pairs)
+
+def synthetic_fps(value: str):
+    try:
+        fps = float(value)
+    except ValueError:
+        raise ValueError(f"synthetic fps {value!r} is not a number")
+
+    if not 0 < fps <= SYNTHETIC_MAX_FPS:
+        raise ValueError(f"synthetic fps must be above 0 and at most {SYNTHETIC_MAX_FPS}, got {value}")
+
+    return fps
+
+def synthetic_size(value: str):
+    # the drawn background is allocated up front, so the size is bounded like a real camera's
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"synthetic size {value!r} is not WIDTHxHEIGHT")
+
+    if not (0 < width <= SYNTHETIC_MAX_SIZE[0] and 0 < height <= SYNTHETIC_MAX_SIZE[1]):
+        raise ValueError(f"synthetic size must be at most {SYNTHETIC_MAX_SIZE[0]}x{SYNTHETIC_MAX_SIZE[1]}, got {value}")
+
+    return width, height
+
+class SyntheticCapture:
+    # a camera without a network for load tests, synthetic://name?size=1280x720&fps=15 draws its frames and
+    # synthetic://name?file=/path/video.avi&fps=15 decodes a local file in a loop, both paced like a live camera
+    def __init__(self, url: str, raw: bool = False):
+        params      = {key: values[-1] for key, values in parse_qs(urlsplit(url).query).items()}
+        self.fps    = synthetic_fps(params.get("fps", "15"))
+        self.file   = params.get("file")
+        self.raw    = raw
+        self.source = None
+        self.index  = 0
+        self.due    = time.monotonic()
+
+        if self.file:
+            self._open_file()
+        else:
+            self.width, self.height = synthetic_size(params.get("size", "1280x720"))
+            self.background         = self._background()
+
+    def _open_file(self):
+        self.source = cv2.VideoCapture(self.file, cv2.CAP_FFMPEG)
+        if self.raw:
+            self.source.set(cv2.CAP_PROP_FORMAT, -1)
+
+    def _background(self):
+        x = np.linspace(0, 255, self.width, dtype = np.uint8)
+
+        return np.repeat(np.tile(x, (self.height, 1))[:, :, None], 3, axis = 2)
+
+    def _render(self):
+        frame  = self.background.copy()
+        center = (self.width // 2, self.height // 2)
+        radius = min(self.width, self.height) // 3
+        angle  = np.radians(self.index * 6 % 270 + 135)
+        tip    = (int(center[0] + radius * np.cos(angle)), int(center[1] + radius * np.sin(angle)))
+
+        cv2.circle(frame, center, radius, (0, 0, 255), 8)
+        cv2.line(frame, center, tip, (0, 0, 0), 6)
+
+        return frame
+
+    def _wait(self):
+        now = time.monotonic()
+        if self.due > now:
+            time.sleep(self.due - now)
+
+        # a consumer that fell behind does not get a burst of frames to catch up
+        self.due = max(self.due, now) + 1 / self.fps
+
+    def isOpened(self):
+        if self.source is not None:
+            return self.source.isOpened()
+
+        # drawn frames have no compressed packets to pass through
+        return not self.raw
+
+    def grab(self):
+        self._wait()
+        self.index += 1
+        if self.source is None:
+            return True
+
+        if self.source.grab():
+            return True
+
+        self.source.release()
+        self._open_file()
+
+        return self.source.grab()
+
+    def retrieve(self, image = None, flag: int = 0):
+        if self.source is not None:
+            return self.source.retrieve(image, flag)
+
+        return True, self._render()
+
+    def read(self):
+        if not self.grab():
+            return False, None
+
+        return self.retrieve()
+
+    def get(self, prop):
+        if self.source is not None:
+            return self.source.get(prop)
+
+        return {
+            cv2.CAP_PROP_FPS                : self.fps,
+            cv2.CAP_PROP_FRAME_WIDTH        : self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT       : self.height,
+            cv2.CAP_PROP_LRF_HAS_KEY_FRAME  : 1,
+        }.get(prop, 0)
+
+    def set(self, prop, value):
+        if self.source is not None:
+            return self.source.set(prop, value)
+
+        return False
+
+    def release(self):
+        if self.source is not None:
+            self.source.release()
+
+def redact_url(url: str):
+    # camera credentials live in the userinfo, only the host and path are fit for a log line
+    parts = urlsplit(url)
+
+    return parts._replace(netloc = parts.netloc.rpartition("@")[2]).geturl()
+
+def open_capture(url: str, transport: str = None, options: str = None, buffer_size: int = 1, raw: bool = False):
+    if urlsplit(url).scheme == SYNTHETIC_SCHEME:
+        return SyntheticCapture(url, raw = raw)
+
+    value = ffmpeg_options(transport, options)
+
+    with open_lock:
+        previous = os.environ.get(FFMPEG_OPTIONS_ENV)
+        if value:
+            os.environ[FFMPEG_OPTIONS_ENV] = value
+        else:
+            os.environ.pop(FFMPEG_OPTIONS_ENV, None)
+
+        try:
+            cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+        finally:
+            if previous is None:
+                os.environ.pop(FFMPEG_OPTIONS_ENV, None)
+            else:
+                os.environ[FFMPEG_OPTIONS_ENV] = previous
+
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+
+    # raw mode hands out the compressed packets as read() results and skips the decoder entirely
+    if raw:
+        cap.set(cv2.CAP_PROP_FORMAT, -1)
+
+    return cap
+
+def is_keyframe(cap):
+    return bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME))
@@ -0,0 +1,48 @@
+import cv2
+import time
+
+class ChangeDetector:
+    def __init__(self, threshold: float, heartbeat: float = 30.0, width: int = 160, pixel_delta: int = 10, regions = None):
+        self.threshold   = threshold
+        self.heartbeat   = heartbeat
+        self.width       = width
+        self.pixel_delta = pixel_delta
+        self.regions     = regions or []
+        self.last        = None
+        self.last_at     = 0.0
+
+    def _thumbnail(self, frame):
+        h, w  = frame.shape[:2]
+        scale = min(1.0, self.width / w)
+        small = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation = cv2.INTER_AREA)
+        gray  = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+        if not self.regions:
+            return [gray]
+
+        return [
+            gray[int(y * scale):int((y + rh) * scale) + 1, int(x * scale):int((x + rw) * scale) + 1]
+            for x, y, rw, rh in self.regions
+        ]
+
+    def score(self, thumbs):
+        scores = []
+        for current, previous in zip(thumbs, self.last):
+            if current.shape != previous.shape or current.size == 0:
+                return 1.0
+
+            changed = cv2.countNonZero(cv2.threshold(cv2.absdiff(current, previous), self.pixel_delta, 255, cv2.THRESH_BINARY)[1])
+            scores.append(changed / current.size)
+
+        return max(scores) if scores else 1.0
+
+    def changed(self, frame, now: float = None):
+        now    = time.monotonic() if now is None else now
+        thumbs = self._thumbnail(frame)
+
+        if self.last is None or len(thumbs) != len(self.last) or now - self.last_at >= self.heartbeat or self.score(thumbs) >= self.threshold:
+            self.last    = thumbs
+            self.last_at = now
+            return True
+
+        return False
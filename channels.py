@@ -0,0 +1,108 @@
+import grpc
+import zlib
+import threading
+import frame_pb2_grpc
+
+COMPRESSION = {
+    "none"    : grpc.Compression.NoCompression,
+    "gzip"    : grpc.Compression.Gzip,
+    "deflate" : grpc.Compression.Deflate,
+}
+
+def channel_options(keepalive_ms: int = 30000, max_message_mb: int = 16):
+    max_message = max_message_mb * 1024 * 1024
+
+    return [
+        ("grpc.keepalive_time_ms", keepalive_ms),
+        ("grpc.keepalive_timeout_ms", max(1000, keepalive_ms // 3)),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        ("grpc.max_send_message_length", max_message),
+        ("grpc.max_receive_message_length", max_message),
+    ]
+
+class PooledChannel:
+    def __init__(self, index: int, target: str, options, compression):
+        self.index   = index
+        self.target  = target
+        self.state   = grpc.ChannelConnectivity.IDLE
+        self.changes = 0
+        self.channel = grpc.insecure_channel(target, options = options, compression = compression)
+        self.stub    = frame_pb2_grpc.FrameServiceStub(self.channel)
+        self.channel.subscribe(self._on_state, try_to_connect = True)
+
+    def _on_state(self, state):
+        self.state    = state
+        self.changes += 1
+
+    def healthy(self):
+        return self.state in (grpc.ChannelConnectivity.READY, grpc.ChannelConnectivity.IDLE)
+
+    def close(self):
+        self.channel.unsubscribe(self._on_state)
+        self.channel.close()
+
+class ChannelPool:
+    def __init__(self, target: str, size: int = 4, options = None, compression: str = "none"):
+        self.target      = target
+        self.size        = max(1, size)
+        self.options     = options if options is not None else channel_options()
+        self.compression = COMPRESSION[compression]
+        self.channels    = {}
+        self.cameras     = {}
+        self.lock        = threading.Lock()
+        self.closed      = False
+
+    def _index(self, key: str):
+        return zlib.crc32(key.encode()) % self.size
+
+    def get(self, key: str, track: bool = True):
+        index = self._index(key)
+
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("channel pool has been closed")
+
+            pooled = self.channels.get(index)
+            if pooled is None:
+                pooled = PooledChannel(index, self.target, self.options, self.compression)
+                self.channels[index] = pooled
+
+            if track:
+                self.cameras[key] = index
+
+        return pooled
+
+    def stub(self, key: str, track: bool = True):
+        return self.get(key, track).stub
+
+    def release(self, key: str):
+        with self.lock:
+            self.cameras.pop(key, None)
+
+    def status(self):
+        with self.lock:
+            channels = list(self.channels.values())
+            cameras  = dict(self.cameras)
+
+        return [
+            {
+                "index"   : pooled.index,
+                "target"  : pooled.target,
+                "state"   : pooled.state.name.lower(),
+                "healthy" : pooled.healthy(),
+                "changes" : pooled.changes,
+                "cameras" : sorted(cam for cam, index in cameras.items() if index == pooled.index),
+            }
+            for pooled in sorted(channels, key = lambda c: c.index)
+        ]
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            channels    = list(self.channels.values())
+            self.channels.clear()
+            self.cameras.clear()
+
+        for pooled in channels:
+            pooled.close()
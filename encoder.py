@@ -0,0 +1,222 @@
+import cv2
+import frame_pb2
+
+JPEG_SUBSAMPLING = {
+    "411" : cv2.IMWRITE_JPEG_SAMPLING_FACTOR_411,
+    "420" : cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420,
+    "422" : cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+    "444" : cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444,
+}
+
+class FrameEncoder:
+    name        = None
+    lossy       = False
+    passthrough = False
+    quality     = 0
+    last_buffer = None
+
+    def set_quality(self, quality: int):
+        pass
+
+    def encoding(self, frame):
+        return self.name
+
+    def dimensions(self, frame):
+        h, w = frame.shape[:2]
+
+        return w, h
+
+    def encode_buffer(self, frame):
+        raise NotImplementedError
+
+    def encode(self, camera_id: str, frame, calibration_id: int = 0, sequence: int = 0, captured_at_us: int = 0, keyframe: bool = True, ring = None):
+        buffer = self.encode_buffer(frame)
+        if buffer is None:
+            return None
+
+        # kept so the snapshot cache can serve the latest image without copying it out of the message
+        self.last_buffer = buffer
+
+        w, h    = self.dimensions(frame)
+        message = frame_pb2.Frame(
+            camera_id      = camera_id,
+            width          = w,
+            height         = h,
+            calibration_id = calibration_id,
+            sequence       = sequence,
+            captured_at_us = captured_at_us,
+            encoding       = self.encoding(frame),
+            quality        = self.quality,
+            keyframe       = keyframe
+        )
+
+        # payloads that do not fit a ring slot still travel inline
+        shared = ring.write(buffer) if ring is not None else None
+        if shared is not None:
+            message.shared.CopyFrom(shared)
+        else:
+            # protobuf only accepts bytes, so tobytes() is the single copy out of the buffer
+            message.data = buffer.tobytes()
+
+        return message
+
+class ImageEncoder(FrameEncoder):
+    extension = None
+    params    = []
+
+    def prepare(self, frame):
+        return frame
+
+    def encode_buffer(self, frame):
+        ok, buffer = cv2.imencode(self.extension, self.prepare(frame), self.params)
+
+        return buffer if ok else None
+
+class JpegEncoder(ImageEncoder):
+    name      = "jpeg"
+    lossy     = True
+    extension = ".jpg"
+
+    def __init__(self, quality: int = 80, optimize: bool = False, subsampling: str = None):
+        self.optimize    = optimize
+        self.subsampling = subsampling
+        self.set_quality(quality)
+
+    def set_quality(self, quality: int):
+        self.quality = quality
+        self.params  = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+
+        if self.optimize:
+            self.params += [int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]
+        if self.subsampling:
+            self.params += [int(cv2.IMWRITE_JPEG_SAMPLING_FACTOR), JPEG_SUBSAMPLING[self.subsampling]]
+
+class WebpEncoder(ImageEncoder):
+    name      = "webp"
+    lossy     = True
+    extension = ".webp"
+
+    def __init__(self, quality: int = 80):
+        self.set_quality(quality)
+
+    def set_quality(self, quality: int):
+        self.quality = quality
+        self.params  = [int(cv2.IMWRITE_WEBP_QUALITY), quality]
+
+class GrayPngEncoder(ImageEncoder):
+    name      = "png-gray"
+    extension = ".png"
+
+    def __init__(self, compression: int = 1):
+        self.params = [int(cv2.IMWRITE_PNG_COMPRESSION), compression]
+
+    def prepare(self, frame):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+class RawEncoder(FrameEncoder):
+    name = "raw"
+
+    def encoding(self, frame):
+        return "raw-bgr24" if frame.ndim == 3 else "raw-gray8"
+
+    def encode_buffer(self, frame):
+        return frame
+
+def annexb_extradata(data: bytes):
+    # mp4 style avcC length-prefixes the parameter sets, the packets are annex b so the sets are sent that way too
+    if len(data) < 7 or data[0] != 1:
+        return data
+
+    sets, count, offset = [], data[5] & 0x1F, 6
+    try:
+        for group in ("sps", "pps"):
+            if group == "pps":
+                count, offset = data[offset], offset + 1
+
+            for _ in range(count):
+                length = int.from_bytes(data[offset:offset + 2], "big")
+                sets.append(b"\x00\x00\x00\x01" + data[offset + 2:offset + 2 + length])
+                offset += 2 + length
+    except IndexError:
+        return data
+
+    return b"".join(sets)
+
+class PassthroughEncoder(FrameEncoder):
+    name        = "passthrough"
+    passthrough = True
+
+    def __init__(self):
+        self.codec     = "unknown"
+        self.width     = 0
+        self.height    = 0
+        self.extradata = b""
+
+    def configure(self, cap):
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        codec  = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00 ").lower()
+
+        self.codec     = codec or "unknown"
+        self.width     = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height    = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.extradata = self._extradata(cap)
+
+    def _extradata(self, cap):
+        # rtsp cameras often send their parameter sets only in the SDP, never in-band with the packets
+        index = int(cap.get(cv2.CAP_PROP_CODEC_EXTRADATA_INDEX))
+        if index <= 0:
+            return b""
+
+        ok, data = cap.retrieve(None, index)
+        if not ok or data is None:
+            return b""
+
+        data = data.tobytes()
+
+        return annexb_extradata(data) if self.codec in ("h264", "avc1") else data
+
+    def encode(self, camera_id: str, frame, calibration_id: int = 0, sequence: int = 0, captured_at_us: int = 0, keyframe: bool = True, ring = None):
+        message = super().encode(camera_id, frame, calibration_id, sequence, captured_at_us, keyframe, ring)
+
+        # every keyframe carries them, so a decoder can start at any of them
+        if message is not None and keyframe and self.extradata:
+            message.extradata = self.extradata
+
+        return message
+
+    def encoding(self, packet):
+        return self.codec
+
+    def dimensions(self, packet):
+        return self.width, self.height
+
+    def encode_buffer(self, packet):
+        return packet
+
+CODECS = {
+    "jpeg"        : JpegEncoder,
+    "webp"        : WebpEncoder,
+    "png-gray"    : GrayPngEncoder,
+    "raw"         : RawEncoder,
+    "passthrough" : PassthroughEncoder,
+}
+
+def create_encoder(name: str = "jpeg", quality: int = 80, **options):
+    if name not in CODECS:
+        raise ValueError(f"unsupported codec {name}")
+
+    encoder = CODECS[name](**options)
+    encoder.set_quality(quality)
+
+    return encoder
+
+def crop(frame, roi):
+    x, y, w, h = roi
+    fh, fw     = frame.shape[:2]
+    x0, y0     = max(0, x), max(0, y)
+    x1, y1     = min(fw, x + w), min(fh, y + h)
+
+    if x1 <= x0 or y1 <= y0:
+        return None
+
+    return frame[y0:y1, x0:x1]
@@ -24,17 +24,25 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0b\x66rame.proto\x12\x0c\x66rameservice\"G\n\x05\x46rame\x12\x11\n\tcamera_id\x18\x01 \x01(\t\x12\r\n\x05width\x18\x02 \x01(\x05\x12\x0e\n\x06height\x18\x03 \x01(\x05\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\x0c\"\x07\n\x05\x45mpty2E\n\x0c\x46rameService\x12\x35\n\tSendFrame\x12\x13.frameservice.Frame\x1a\x13.frameservice.Emptyb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0b\x66rame.proto\x12\x0c\x66rameservice\"\xfb\x01\n\x05\x46rame\x12\x11\n\tcamera_id\x18\x01 \x01(\t\x12\r\n\x05width\x18\x02 \x01(\x05\x12\x0e\n\x06height\x18\x03 \x01(\x05\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\x0c\x12\x16\n\x0e\x63\x61libration_id\x18\x05 \x01(\x05\x12\x10\n\x08sequence\x18\x06 \x01(\x04\x12\x16\n\x0e\x63\x61ptured_at_us\x18\x07 \x01(\x03\x12\x10\n\x08\x65ncoding\x18\x08 \x01(\t\x12\x0f\n\x07quality\x18\t \x01(\x05\x12\x10\n\x08keyframe\x18\n \x01(\x08\x12(\n\x06shared\x18\x0b \x01(\x0b\x32\x18.frameservice.SharedSlot\x12\x11\n\textradata\x18\x0c \x01(\x0c\"_\n\nSharedSlot\x12\x0f\n\x07segment\x18\x01 \x01(\t\x12\x0c\n\x04slot\x18\x02 \x01(\r\x12\x0e\n\x06offset\x18\x03 \x01(\x04\x12\x0e\n\x06length\x18\x04 \x01(\r\x12\x12\n\ngeneration\x18\x05 \x01(\x04\"1\n\nFrameBatch\x12#\n\x06\x66rames\x18\x01 \x03(\x0b\x32\x13.frameservice.Frame\"\x07\n\x05\x45mpty\"/\n\x03\x41\x63k\x12\x10\n\x08sequence\x18\x01 \x01(\x04\x12\x16\n\x0e\x63\x61libration_id\x18\x02 \x01(\x05\"\"\n\x07Summary\x12\x17\n\x0f\x66rames_received\x18\x01 \x01(\x03\x32\xc9\x01\n\x0c\x46rameService\x12\x35\n\tSendFrame\x12\x13.frameservice.Frame\x1a\x13.frameservice.Empty\x12?\n\x11StreamFramesAcked\x12\x13.frameservice.Frame\x1a\x11.frameservice.Ack(\x01\x30\x01\x12\x41\n\x0eSendFrameBatch\x12\x18.frameservice.FrameBatch\x1a\x15.frameservice.Summaryb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'frame_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_FRAME']._serialized_start=29
-  _globals['_FRAME']._serialized_end=100
-  _globals['_EMPTY']._serialized_start=102
-  _globals['_EMPTY']._serialized_end=109
-  _globals['_FRAMESERVICE']._serialized_start=111
-  _globals['_FRAMESERVICE']._serialized_end=180
+  _globals['_FRAME']._serialized_start=30
+  _globals['_FRAME']._serialized_end=281
+  _globals['_SHAREDSLOT']._serialized_start=283
+  _globals['_SHAREDSLOT']._serialized_end=378
+  _globals['_FRAMEBATCH']._serialized_start=380
+  _globals['_FRAMEBATCH']._serialized_end=429
+  _globals['_EMPTY']._serialized_start=431
+  _globals['_EMPTY']._serialized_end=438
+  _globals['_ACK']._serialized_start=440
+  _globals['_ACK']._serialized_end=487
+  _globals['_SUMMARY']._serialized_start=489
+  _globals['_SUMMARY']._serialized_end=523
+  _globals['_FRAMESERVICE']._serialized_start=526
+  _globals['_FRAMESERVICE']._serialized_end=727
 # @@protoc_insertion_point(module_scope)
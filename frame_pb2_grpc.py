@@ -39,6 +39,16 @@ class FrameServiceStub(object):
                 request_serializer=frame__pb2.Frame.SerializeToString,
                 response_deserializer=frame__pb2.Empty.FromString,
                 _registered_method=True)
+        self.StreamFramesAcked = channel.stream_stream(
+                '/frameservice.FrameService/StreamFramesAcked',
+                request_serializer=frame__pb2.Frame.SerializeToString,
+                response_deserializer=frame__pb2.Ack.FromString,
+                _registered_method=True)
+        self.SendFrameBatch = channel.unary_unary(
+                '/frameservice.FrameService/SendFrameBatch',
+                request_serializer=frame__pb2.FrameBatch.SerializeToString,
+                response_deserializer=frame__pb2.Summary.FromString,
+                _registered_method=True)
 
 
 class FrameServiceServicer(object):
@@ -50,6 +60,18 @@ class FrameServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamFramesAcked(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SendFrameBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_FrameServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -58,6 +80,16 @@ def add_FrameServiceServicer_to_server(servicer, server):
                     request_deserializer=frame__pb2.Frame.FromString,
                     response_serializer=frame__pb2.Empty.SerializeToString,
             ),
+            'StreamFramesAcked': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamFramesAcked,
+                    request_deserializer=frame__pb2.Frame.FromString,
+                    response_serializer=frame__pb2.Ack.SerializeToString,
+            ),
+            'SendFrameBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.SendFrameBatch,
+                    request_deserializer=frame__pb2.FrameBatch.FromString,
+                    response_serializer=frame__pb2.Summary.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'frameservice.FrameService', rpc_method_handlers)
@@ -95,3 +127,57 @@ class FrameService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def StreamFramesAcked(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/frameservice.FrameService/StreamFramesAcked',
+            frame__pb2.Frame.SerializeToString,
+            frame__pb2.Ack.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SendFrameBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/frameservice.FrameService/SendFrameBatch',
+            frame__pb2.FrameBatch.SerializeToString,
+            frame__pb2.Summary.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,68 @@
+import bisect
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts  = [0] * (len(self.buckets) + 1)
+        self.sum     = 0.0
+        self.count   = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        if not self.count:
+            return None
+
+        rank  = q * self.count
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= rank:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+
+        return self.buckets[-1]
+
+    def cumulative(self):
+        total  = 0
+        counts = []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+
+        return counts
+
+    def snapshot(self):
+        def ms(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            "count"   : self.count,
+            "mean_ms" : ms(self.sum / self.count) if self.count else None,
+            "p50_ms"  : ms(self.quantile(0.5)),
+            "p90_ms"  : ms(self.quantile(0.9)),
+            "p99_ms"  : ms(self.quantile(0.99)),
+            "buckets" : {
+                str(ms(bound)) if bound is not None else "+Inf": count
+                for bound, count in zip(self.buckets + (None,), self.cumulative())
+            },
+        }
+
+# ack is the server's answer for the frame, an Ack on StreamFramesAcked or the SendFrame/SendFrameBatch response
+class LatencyTracker:
+    STAGES = ("capture_to_send", "send_to_ack", "capture_to_ack")
+
+    def __init__(self):
+        self.histograms = {stage: Histogram() for stage in self.STAGES}
+
+    def observe(self, captured_at: float, sent_at: float, acked_at: float):
+        self.histograms["capture_to_send"].observe(sent_at - captured_at)
+        self.histograms["send_to_ack"].observe(acked_at - sent_at)
+        self.histograms["capture_to_ack"].observe(acked_at - captured_at)
+
+    def snapshot(self):
+        return {stage: histogram.snapshot() for stage, histogram in self.histograms.items()}
@@ -0,0 +1,127 @@
+import time
+import threading
+
+from latency import Histogram
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+CAMERA_COUNTERS = {
+    "captured"   : ("lugh_frames_captured_total", "Frames grabbed from the camera"),
+    "skipped"    : ("lugh_frames_skipped_total", "Frames skipped by the rate policy"),
+    "unchanged"  : ("lugh_frames_unchanged_total", "Frames skipped by the change detector"),
+    "dropped"    : ("lugh_frames_dropped_total", "Frames dropped from full pipeline queues"),
+    "encoded"    : ("lugh_frames_encoded_total", "Frames encoded"),
+    "crops"      : ("lugh_region_crops_total", "Calibration regions cropped and encoded from the frames, one message each"),
+    "sent"       : ("lugh_frames_sent_total", "Frames the grpc server acked or answered"),
+    "failed"     : ("lugh_frames_failed_total", "Frames that could not be sent"),
+    "desynced"   : ("lugh_frames_desynced_total", "Passthrough packets discarded while waiting for a keyframe"),
+    "bytes"      : ("lugh_bytes_sent_total", "Encoded bytes of the frames the grpc server acked or answered"),
+    "spooled"    : ("lugh_frames_spooled_total", "Frames written to the disk spool while no backend was reachable"),
+    "replayed"   : ("lugh_frames_replayed_total", "Spooled frames replayed to the grpc server"),
+    "reconnects" : ("lugh_camera_reconnects_total", "Camera reconnect attempts"),
+}
+
+CAMERA_HISTOGRAMS = {
+    "encode"         : ("lugh_encode_seconds", "Time spent encoding one frame"),
+    "send_to_ack"    : ("lugh_send_seconds", "Time from handing a frame to grpc until the server's Ack or response for it arrives"),
+    "capture_to_ack" : ("lugh_capture_to_ack_seconds", "Time from capture until the server's Ack or response for the frame arrives"),
+}
+
+def format_labels(labels):
+    if not labels:
+        return ""
+
+    pairs = ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels)
+
+    return "{" + pairs + "}"
+
+def format_value(value):
+    if value is None:
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Registry:
+    def __init__(self):
+        self.lock     = threading.Lock()
+        self.families = {}
+
+    def describe(self, name: str, kind: str, help: str):
+        with self.lock:
+            self.families.setdefault(name, (kind, help, {}))
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        with self.lock:
+            samples         = self.families[name][2]
+            samples[labels] = samples.get(labels, 0) + value
+
+    def set(self, name: str, labels: tuple = (), value: float = 0):
+        with self.lock:
+            self.families[name][2][labels] = value
+
+    def observe(self, name: str, labels: tuple = (), value: float = 0):
+        with self.lock:
+            samples   = self.families[name][2]
+            histogram = samples.get(labels)
+            if histogram is None:
+                histogram = samples[labels] = Histogram()
+
+            histogram.observe(value)
+
+    def add(self, name: str, labels: tuple, histogram: Histogram):
+        with self.lock:
+            self.families[name][2][labels] = histogram
+
+    def render(self):
+        lines = []
+        with self.lock:
+            families = [(name, kind, help, dict(samples)) for name, (kind, help, samples) in self.families.items()]
+
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            for labels, value in samples.items():
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                    continue
+
+                for bound, count in zip(value.buckets + (None,), value.cumulative()):
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', format_value(bound)),))} {count}")
+
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(value.sum)}")
+                lines.append(f"{name}_count{format_labels(labels)} {value.count}")
+
+        return "\n".join(lines) + "\n"
+
+def camera_registry(cameras: dict):
+    registry = Registry()
+    for name, help in CAMERA_COUNTERS.values():
+        registry.describe(name, "counter", help)
+    registry.describe("lugh_queue_depth", "gauge", "Frames waiting in the pipeline queues")
+    for name, help in CAMERA_HISTOGRAMS.values():
+        registry.describe(name, "histogram", help)
+
+    for camera_id, data in cameras.items():
+        labels = (("camera_id", camera_id),)
+
+        for key, (name, _) in CAMERA_COUNTERS.items():
+            registry.set(name, labels, data["counters"][key])
+        registry.set("lugh_queue_depth", labels, data["queued"])
+        for key, (name, _) in CAMERA_HISTOGRAMS.items():
+            registry.add(name, labels, data["histograms"][key])
+
+    return registry
+
+def instrument_provider(provider, registry: Registry, name: str = "lugh_db_query_seconds"):
+    registry.describe(name, "histogram", "Time spent executing one SQL statement")
+    execute = provider.execute
+
+    def timed_execute(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return execute(*args, **kwargs)
+        finally:
+            registry.observe(name, (), time.perf_counter() - start)
+
+    provider.execute = timed_execute
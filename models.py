@@ -1,9 +1,21 @@
+import sqlite3
+
 from enum import Enum
 from passlib.hash import argon2
-from pony.orm import Database, Required, Set
+from pony.orm import Database, Required, Optional, Set
 
 db = Database()
 
+# called with the user id whenever a user row is updated or deleted
+user_listeners = []
+
+# replaced by the app once the argon2 parameters are read from the environment
+password_hasher = argon2
+
+def set_password_hasher(hasher):
+    global password_hasher
+    password_hasher = hasher
+
 class NeedleType(str, Enum):
     LONG  = "long"
     SHORT = "short"
@@ -24,8 +36,21 @@ class CctvConnection(db.Entity):
     calibrations = Set('GaugeCalibration')
 
 class GaugeCalibration(db.Entity):
-    gauge_type      = Required(GaugeType)
-    cctv_connection = Required(CctvConnection)
+    gauge_type        = Required(GaugeType)
+    cctv_connection   = Required(CctvConnection)
+    change_threshold  = Optional(float, nullable=True)
+    heartbeat_seconds = Optional(float, nullable=True)
+    roi_x             = Optional(int, nullable=True)
+    roi_y             = Optional(int, nullable=True)
+    roi_width         = Optional(int, nullable=True)
+    roi_height        = Optional(int, nullable=True)
+
+    def roi(self):
+        # rows saved before partial regions were rejected still read as having no region
+        if None in (self.roi_x, self.roi_y, self.roi_width, self.roi_height):
+            return None
+
+        return (self.roi_x, self.roi_y, self.roi_width, self.roi_height)
 
 class User(db.Entity):
     name = Required(str)
@@ -33,7 +58,58 @@ class User(db.Entity):
     password = Required(str)
 
     def set_password(self, raw_password):
-        self.password = argon2.hash(raw_password)
+        self.password = password_hasher.hash(raw_password)
 
     def verify_password(self, raw_password):
-        return argon2.verify(raw_password, self.password)
\ No newline at end of file
+        return password_hasher.verify(raw_password, self.password)
+
+    def after_update(self):
+        for listener in user_listeners:
+            listener(self.id)
+
+    def after_delete(self):
+        for listener in user_listeners:
+            listener(self.id)
+
+# columns added after the first release, create_tables does not add them to existing tables
+SCHEMA_UPGRADES = {
+    "GaugeCalibration": {
+        "change_threshold"  : "REAL",
+        "heartbeat_seconds" : "REAL",
+        "roi_x"             : "INTEGER",
+        "roi_y"             : "INTEGER",
+        "roi_width"         : "INTEGER",
+        "roi_height"        : "INTEGER",
+    },
+}
+
+# pony only indexes foreign keys when it creates a table, older or hand-made databases may lack them
+SCHEMA_INDEXES = {
+    "GaugeCalibration": {
+        "idx_gaugecalibration__gauge_type"      : "gauge_type",
+        "idx_gaugecalibration__cctv_connection" : "cctv_connection",
+    },
+}
+
+def upgrade_schema(filename):
+    conn = sqlite3.connect(filename)
+    try:
+        for table, columns in SCHEMA_UPGRADES.items():
+            existing = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+            if not existing:
+                continue
+
+            for column, kind in columns.items():
+                if column not in existing:
+                    conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {kind}')
+
+        for table, indexes in SCHEMA_INDEXES.items():
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+                continue
+
+            for index, column in indexes.items():
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{index}" ON "{table}" ("{column}")')
+
+        conn.commit()
+    finally:
+        conn.close()
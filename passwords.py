@@ -0,0 +1,49 @@
+import asyncio
+
+from passlib.hash import argon2
+from concurrent.futures import ThreadPoolExecutor
+
+def create_hasher(time_cost: int = 3, memory_kib: int = 65536, parallelism: int = 4):
+    return argon2.using(rounds = time_cost, memory_cost = memory_kib, parallelism = parallelism)
+
+class PasswordBusy(Exception):
+    pass
+
+class PasswordExecutor:
+    def __init__(self, hasher, threads: int = 2, queue: int = 32):
+        self.hasher   = hasher
+        self.executor = ThreadPoolExecutor(max_workers = max(1, threads), thread_name_prefix = "argon2")
+        self.queue    = max(1, queue)
+        self.pending  = 0
+        self.rejected = 0
+
+    async def _run(self, fn, *args):
+        # only touched from the event loop, so a plain counter bounds the hashes waiting for a thread
+        if self.pending >= self.queue:
+            self.rejected += 1
+            raise PasswordBusy(f"{self.pending} password hashes are already queued")
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def _verify(self, password: str, hash: str):
+        if not self.hasher.verify(password, hash):
+            return False, None
+
+        # a hash made with older parameters is replaced while the plain password is at hand
+        return True, self.hasher.hash(password) if self.hasher.needs_update(hash) else None
+
+    async def verify(self, password: str, hash: str):
+        return await self._run(self._verify, password, hash)
+
+    async def hash(self, password: str):
+        return await self._run(self.hasher.hash, password)
+
+    def status(self):
+        return {"threads": self.executor._max_workers, "queue": self.queue, "pending": self.pending, "rejected": self.rejected}
+
+    def shutdown(self):
+        self.executor.shutdown(wait = False, cancel_futures = True)
@@ -0,0 +1,530 @@
+import time
+import random
+import hashlib
+import functools
+import threading
+import collections
+import frame_pb2
+
+from capture import open_capture, is_keyframe, redact_url
+from encoder import JpegEncoder, create_encoder, crop
+from policy import FramePolicy
+from change import ChangeDetector
+from latency import Histogram, LatencyTracker
+from sharedmem import SharedRing
+from spool import FrameSpool, SpoolBusy
+from backends import is_failover_error
+
+STATE_CONNECTING = "connecting"
+STATE_STREAMING  = "streaming"
+STATE_BACKOFF    = "backoff"
+STATE_FAILED     = "failed"
+STATE_STOPPED    = "stopped"
+
+# packets cannot be dropped as freely as decoded frames, so passthrough queues absorb a burst
+PASSTHROUGH_QUEUE = 64
+
+# how long replay waits after the backend turned it away before trying the same frame again
+REPLAY_RETRY_S = 5.0
+
+def backoff_delay(attempt: int, initial: float, maximum: float):
+    delay = min(maximum, initial * 2 ** (attempt - 1))
+
+    return delay * random.uniform(0.8, 1.0)
+
+class LatestQueue:
+    def __init__(self, maxsize: int = 1):
+        self.items   = collections.deque()
+        self.maxsize = max(1, maxsize)
+        self.cond    = threading.Condition()
+        self.closed  = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout: float = None):
+        with self.cond:
+            if not self.items and not self.closed:
+                self.cond.wait(timeout)
+
+            if not self.items:
+                return None
+
+            return self.items.popleft()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+class PipelineStats:
+    def __init__(self):
+        self.captured   = 0
+        self.skipped    = 0
+        self.unchanged  = 0
+        self.encoded    = 0
+        self.crops      = 0
+        self.sent       = 0
+        self.failed     = 0
+        self.desynced   = 0
+        self.bytes      = 0
+        self.spooled    = 0
+        self.replayed   = 0
+        self.reconnects = 0
+
+    def as_dict(self, *queues):
+        # both count frames, a frame cut into several regions is encoded once here and counted per region in crops
+        gated = self.unchanged + self.encoded
+
+        return {
+            "captured"   : self.captured,
+            "skipped"    : self.skipped,
+            "unchanged"  : self.unchanged,
+            "skip_ratio" : round(self.unchanged / gated, 4) if gated else 0.0,
+            "dropped"    : sum(q.dropped for q in queues),
+            "encoded"    : self.encoded,
+            "crops"      : self.crops,
+            "sent"       : self.sent,
+            "failed"     : self.failed,
+            "desynced"   : self.desynced,
+            "bytes"      : self.bytes,
+            "spooled"    : self.spooled,
+            "replayed"   : self.replayed,
+            "reconnects" : self.reconnects,
+        }
+
+class CameraPipeline:
+    def __init__(self, camera_id: str, rtsp_url: str, sender_factory, queue_size: int = 1, policy: FramePolicy = None, detector = None, regions = None, capture: dict = None, codec: dict = None, shared: dict = None, spool: dict = None):
+        self.camera_id      = camera_id
+        self.rtsp_url       = rtsp_url
+        self.sender_factory = sender_factory
+        self.policy         = policy or FramePolicy()
+        self.capture        = capture or {}
+        self.shared         = shared
+        self.ring           = None
+        self.spool_options  = dict(spool or {})
+        self.replay_fps     = self.spool_options.pop("replay_fps", 10.0)
+        self.spool          = None
+        self.spool_users    = 0
+        self.spool_lock     = threading.Lock()
+        self.encoder        = create_encoder(quality = self.policy.quality, **(codec or {}))
+        self.detector       = detector if not self.encoder.passthrough else None
+        self.regions        = (regions or []) if not self.encoder.passthrough else []
+        queue_size          = max(queue_size, PASSTHROUGH_QUEUE) if self.encoder.passthrough else queue_size
+        self.frames         = LatestQueue(queue_size)
+        self.messages       = LatestQueue(queue_size)
+        self.stats          = PipelineStats()
+        self.latency        = LatencyTracker()
+        self.encode_time    = Histogram()
+        self.snapshot_codec = JpegEncoder(self.policy.quality)
+        self.latest         = None
+        self.last_error     = None
+        self.dropped        = 0
+        self.resync         = False
+        self.sequence       = 0
+        self.running        = False
+        self.stopped        = threading.Event()
+        self.state          = STATE_STOPPED
+        self.threads        = []
+
+    def prepare(self):
+        self.running = True
+        self.state   = STATE_CONNECTING
+        self.ring    = SharedRing(self.camera_id, **self.shared) if self.shared else None
+        self.spool   = self.open_spool() if self.spool_options else None
+        self.stopped.clear()
+
+    def start(self):
+        self.prepare()
+        self.threads = [
+            threading.Thread(target = self._capture, name = f"capture-{self.camera_id}", daemon = True),
+            threading.Thread(target = self._encode, name = f"encode-{self.camera_id}", daemon = True),
+            threading.Thread(target = self._send, name = f"send-{self.camera_id}", daemon = True),
+        ]
+        if self.spool is not None:
+            self.threads.append(threading.Thread(target = self._replay, name = f"replay-{self.camera_id}", daemon = True))
+            # the send and replay threads both use the spool, the second of them to finish closes it
+            self.spool_users = 2
+
+        for t in self.threads:
+            t.start()
+
+    def stop(self, timeout: float = None):
+        self.running = False
+        self.stopped.set()
+        self.frames.close()
+        self.messages.close()
+
+        # one deadline for all stages, so a stop waits at most timeout however many threads there are
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for t in self.threads:
+            if t is not threading.current_thread():
+                t.join(max(0, deadline - time.monotonic()) if deadline is not None else None)
+
+    def status(self):
+        data = {"camera_id": self.camera_id, "state": self.state, "queued": len(self.frames) + len(self.messages)}
+        data.update(self.stats.as_dict(self.frames, self.messages))
+        data.update(self.policy.status())
+        data["last_error"] = self.last_error
+        if self.ring is not None:
+            data["shared"] = self.ring.status()
+        if self.spool is not None:
+            data["spool"] = self.spool.status()
+
+        return data
+
+    def metrics(self):
+        histograms           = dict(self.latency.histograms)
+        histograms["encode"] = self.encode_time
+
+        return {
+            "counters"   : self.stats.as_dict(self.frames, self.messages),
+            "queued"     : len(self.frames) + len(self.messages),
+            "histograms" : histograms,
+        }
+
+    def _capture(self):
+        attempts = 0
+
+        while self.running:
+            self.state = STATE_CONNECTING
+            print(f"attempting to connect from to {redact_url(self.rtsp_url)}")
+
+            cap = None
+            try:
+                cap = open_capture(self.rtsp_url, self.capture.get("transport"), self.capture.get("ffmpeg_options"), raw = self.encoder.passthrough)
+                if cap.isOpened():
+                    print(f"connected to {redact_url(self.rtsp_url)}")
+                    if self.encoder.passthrough:
+                        self.encoder.configure(cap)
+                    self.state = STATE_STREAMING
+                    # a camera that accepts the connection but never delivers a frame keeps backing off
+                    if self._read(cap):
+                        attempts = 0
+                else:
+                    print(f"unable to connect to {redact_url(self.rtsp_url)}")
+            except Exception as e:
+                # an attempt that raises backs off like a lost stream instead of ending the thread with running still set
+                self.last_error = str(e) or type(e).__name__
+                print(f"capture of camera with id of {self.camera_id} failed: {self.last_error}")
+            finally:
+                if cap is not None:
+                    cap.release()
+
+            if not self.running:
+                break
+
+            attempts += 1
+            self.stats.reconnects += 1
+
+            max_attempts = self.capture.get("max_attempts", 0)
+            if max_attempts and attempts >= max_attempts:
+                print(f"giving up on camera with id of {self.camera_id} after {attempts} attempts")
+                self.state   = STATE_FAILED
+                self.running = False
+                self.frames.close()
+                self.messages.close()
+                return
+
+            delay = backoff_delay(attempts, self.capture.get("backoff_initial", 1.0), self.capture.get("backoff_max", 60.0))
+            print(f"reconnecting to camera with id of {self.camera_id} in {delay:.1f}s")
+
+            self.state = STATE_BACKOFF
+            self.stopped.wait(delay)
+
+        self.state = STATE_STOPPED
+        print(f"the streaming data of camera with id of {self.camera_id} has ended")
+
+    def _read(self, cap):
+        passthrough   = self.encoder.passthrough
+        grab          = self.capture.get("grab_skipped", True) and not passthrough
+        read_failures = self.capture.get("read_failures", 10)
+        failures      = 0
+        streamed      = False
+
+        while self.running:
+            if grab:
+                ret = cap.grab()
+            else:
+                ret, frame = cap.read()
+
+            if not ret:
+                failures += 1
+                if failures >= read_failures:
+                    print(f"lost the stream of camera with id of {self.camera_id}")
+                    return streamed
+
+                self.stopped.wait(0.1)
+                continue
+
+            failures    = 0
+            streamed    = True
+            captured_at = time.time()
+            captured    = time.monotonic()
+            self.stats.captured += 1
+
+            # compressed packets depend on their predecessors, so only decoded frames can be rate limited
+            if not passthrough and not self.policy.admit():
+                self.stats.skipped += 1
+                continue
+
+            # frames rejected by the policy were only grabbed, the BGR conversion happens here
+            if grab:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+
+            self.frames.put((frame, captured_at, captured, is_keyframe(cap) if passthrough else True))
+
+        return streamed
+
+    def encode_item(self, item):
+        frame, captured_at, captured, keyframe = item
+
+        # only a reference to the newest frame is kept, it is encoded for a snapshot when one is asked for
+        if not self.encoder.passthrough:
+            self.latest = (frame, captured_at, None)
+
+        if self.detector is not None and not self.detector.changed(frame):
+            self.stats.unchanged += 1
+            return None
+
+        if self.encoder.lossy and self.encoder.quality != self.policy.quality:
+            self.encoder.set_quality(self.policy.quality)
+
+        # every crop of one frame shares its sequence, gaps on the server mean dropped frames
+        self.sequence += 1
+        metadata       = {"sequence": self.sequence, "captured_at_us": int(captured_at * 1_000_000), "keyframe": keyframe}
+
+        start    = time.perf_counter()
+        messages = self._encode_regions(frame, metadata) if self.regions else [self.encoder.encode(self.camera_id, frame, ring = self.ring, **metadata)]
+        messages = [message for message in messages if message is not None]
+        self.encode_time.observe(time.perf_counter() - start)
+        if not messages:
+            return None
+
+        if self.encoder.name == "jpeg" and not self.regions:
+            self.latest = (frame, captured_at, self.encoder.last_buffer)
+
+        self.stats.encoded += 1
+        if self.regions:
+            self.stats.crops += len(messages)
+
+        return messages, captured
+
+    def snapshot(self, known = ()):
+        latest = self.latest
+        if latest is None:
+            return None
+
+        frame, captured_at, buffer = latest
+        # hashed, a camera id can hold quotes or characters a latin-1 header cannot carry
+        etag = '"' + hashlib.blake2b(f"{self.camera_id}-{int(captured_at * 1_000_000)}".encode(), digest_size = 12).hexdigest() + '"'
+        if etag in known or "*" in known:
+            return {"etag": etag, "captured_at": captured_at, "data": None}
+
+        if buffer is None:
+            buffer = self.snapshot_codec.encode_buffer(frame)
+            if buffer is None:
+                return None
+
+            # later requests for the same frame reuse this encoding
+            if self.latest is latest:
+                self.latest = (frame, captured_at, buffer)
+
+        return {"etag": etag, "captured_at": captured_at, "data": buffer.reshape(-1)}
+
+    def release(self):
+        # the encode stage is the only writer, so the segment is released once it stops
+        if self.ring is not None:
+            self.ring.close()
+
+    def _encode(self):
+        while self.running:
+            item = self.frames.get(timeout = 1.0)
+            if item is None:
+                continue
+
+            encoded = self.encode_item(item)
+            if encoded is not None:
+                self.messages.put(encoded)
+
+        self.release()
+
+    def _encode_regions(self, frame, metadata: dict):
+        messages = []
+        for calibration_id, roi in self.regions:
+            region = crop(frame, roi)
+            if region is not None:
+                messages.append(self.encoder.encode(self.camera_id, region, calibration_id, ring = self.ring, **metadata))
+
+        return messages
+
+    def synced(self, message):
+        if not self.encoder.passthrough:
+            return True
+
+        # a dropped or failed packet breaks decoding on the server until the next keyframe
+        dropped = self.frames.dropped + self.messages.dropped
+        if dropped != self.dropped:
+            self.dropped = dropped
+            self.resync  = True
+
+        if self.resync and not message.keyframe:
+            self.stats.desynced += 1
+            return False
+
+        self.resync = False
+
+        return True
+
+    def _send(self):
+        sender = self.sender_factory(self.camera_id)
+
+        while self.running:
+            item = self.messages.get(timeout = 1.0)
+            if item is None:
+                continue
+
+            messages, captured = item
+            for message in messages:
+                if not self.synced(message):
+                    continue
+
+                # the frame counts once the server acknowledged it, the sender keeps a window of them in flight
+                sender.send(message, functools.partial(self.completed, message, captured, time.monotonic()))
+
+        sender.close()
+        self.close_spool()
+
+    def completed(self, message, captured: float, start: float, error = None):
+        if error is None:
+            self.sent(message, captured, start)
+            return
+
+        self.failed(error, start)
+        if self.spool is not None and is_failover_error(error):
+            self.store(message)
+
+    def sent(self, message, captured: float, start: float):
+        acked = time.monotonic()
+
+        self.stats.sent  += 1
+        self.stats.bytes += message.shared.length or len(message.data)
+        self.policy.observe(acked - start)
+        self.latency.observe(captured, start, acked)
+
+    def failed(self, error, start: float):
+        # failures are counted and surfaced through /status and /metrics instead of printed per frame
+        self.stats.failed += 1
+        self.last_error    = str(error) or type(error).__name__
+        self.resync        = True
+        self.policy.observe(time.monotonic() - start, ok = False)
+
+    def store(self, message):
+        # frames that reached no backend wait on disk until replay gets them through
+        if message.HasField("shared"):
+            data = self.ring.take(message.shared) if self.ring is not None else None
+            if data is None:
+                return
+
+            inline = frame_pb2.Frame()
+            inline.CopyFrom(message)
+            inline.ClearField("shared")
+            inline.data = data
+            message     = inline
+
+        if self.spool.append(message):
+            self.stats.spooled += 1
+
+    def replayed(self, offset: int, error = None):
+        if error is not None and is_failover_error(error):
+            return REPLAY_RETRY_S
+
+        # any other error will not go away on a retry, so the frame is skipped
+        if error is not None:
+            self.stats.failed += 1
+            self.last_error    = str(error) or type(error).__name__
+        else:
+            self.stats.replayed += 1
+
+        self.spool.commit(offset)
+
+        return 1.0 / self.replay_fps if self.replay_fps > 0 else 0
+
+    def _replay(self):
+        sender = self.sender_factory(self.camera_id)
+
+        while self.running:
+            record = self.spool.next()
+            if record is None:
+                self.stopped.wait(1.0)
+                continue
+
+            message, offset = record
+            try:
+                sender.send(message)
+                delay = self.replayed(offset)
+            except Exception as e:
+                delay = self.replayed(offset, e)
+
+            self.stopped.wait(delay)
+
+        sender.close()
+        self.close_spool()
+
+    def reconfigure(self, detector: dict = None, regions: list = None):
+        # passthrough packets are never decoded, so there is nothing to compare or crop
+        if self.encoder.passthrough:
+            return
+
+        # a fresh detector has no previous frame, the next one is sent with the new regions straight away
+        self.detector = ChangeDetector(**detector) if detector else None
+        self.regions  = regions or []
+
+    def open_spool(self):
+        try:
+            spool = FrameSpool(camera_id = self.camera_id, **self.spool_options)
+        except SpoolBusy as e:
+            print(f"{e}, frames of camera with id of {self.camera_id} will not be spooled")
+            return None
+
+        return spool
+
+    def close_spool(self):
+        if self.spool is None:
+            return
+
+        with self.spool_lock:
+            self.spool_users -= 1
+            if self.spool_users > 0:
+                return
+
+        self.spool.close()
+
+def build_pipeline(spec: dict, sender_factory):
+    detector = spec.get("detector")
+
+    return CameraPipeline(
+        spec["camera_id"],
+        spec["rtsp_url"],
+        sender_factory,
+        queue_size = spec.get("queue_size", 1),
+        policy     = FramePolicy(**spec.get("policy", {})),
+        detector   = ChangeDetector(**detector) if detector else None,
+        regions    = spec.get("regions"),
+        capture    = spec.get("capture"),
+        codec      = spec.get("codec"),
+        shared     = spec.get("shared"),
+        spool      = spec.get("spool")
+    )
@@ -0,0 +1,101 @@
+import time
+import threading
+
+class FramePolicy:
+    def __init__(
+        self,
+        target_fps: float = None,
+        quality: int = 80,
+        adaptive: bool = False,
+        min_fps: float = 0.2,
+        min_quality: int = 30,
+        latency_high: float = 0.2,
+        error_high: float = 0.05,
+        interval: float = 2.0,
+    ):
+        self.target_fps     = target_fps or None
+        self.target_quality = quality
+        self.fps            = self.target_fps
+        self.quality        = quality
+        self.adaptive       = adaptive
+        self.min_fps        = min_fps
+        self.min_quality    = min_quality
+        self.latency_high   = latency_high
+        self.error_high     = error_high
+        self.interval       = interval
+        self.latency        = None
+        self.latency_sum    = 0.0
+        self.next_at        = 0.0
+        self.window_at      = time.monotonic()
+        self.offered        = 0
+        self.sent           = 0
+        self.errors         = 0
+        self.lock           = threading.Lock()
+
+    def admit(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        self.offered += 1
+
+        if self.adaptive and now - self.window_at >= self.interval:
+            self._adapt(now)
+
+        if not self.fps:
+            return True
+
+        if now < self.next_at:
+            return False
+
+        period       = 1.0 / self.fps
+        self.next_at = max(self.next_at + period, now - period)
+
+        return True
+
+    def observe(self, latency: float, ok: bool = True):
+        with self.lock:
+            self.latency_sum += latency
+            if ok:
+                self.sent += 1
+            else:
+                self.errors += 1
+
+    def _adapt(self, now: float):
+        with self.lock:
+            elapsed = now - self.window_at
+            offered = self.offered / elapsed
+            total   = self.sent + self.errors
+            errors  = self.errors / total if total else 0.0
+            latency = self.latency_sum / total if total else 0.0
+
+            self.window_at   = now
+            self.offered     = 0
+            self.sent        = 0
+            self.errors      = 0
+            self.latency_sum = 0.0
+
+        if not total:
+            return
+
+        self.latency = latency
+
+        ceiling = self.target_fps or offered
+
+        if latency > self.latency_high or errors > self.error_high:
+            current      = self.fps or ceiling
+            self.fps     = max(self.min_fps, current * 0.5)
+            self.quality = max(self.min_quality, self.quality - 10)
+            return
+
+        if self.fps is not None and ceiling and self.fps * 1.25 < ceiling:
+            self.fps = self.fps * 1.25
+        else:
+            self.fps = self.target_fps
+
+        self.quality = min(self.target_quality, self.quality + 5)
+
+    def status(self):
+        return {
+            "fps"        : round(self.fps, 2) if self.fps else None,
+            "quality"    : self.quality,
+            "adaptive"   : self.adaptive,
+            "latency_ms" : round(self.latency * 1000, 2) if self.latency is not None else None,
+        }
@@ -0,0 +1,35 @@
+import time
+
+from ttlcache import TTLCache
+
+class RateLimiter:
+    def __init__(self, limit: int = 5, window: float = 300.0, maxsize: int = 4096):
+        self.limit    = limit
+        self.window   = window
+        # least recently seen keys are evicted first, so a flood of made up keys cannot grow it without bound
+        self.attempts = TTLCache(maxsize, window)
+
+    def _recent(self, key, now: float):
+        return tuple(at for at in self.attempts.get(key, ()) if at > now - self.window)
+
+    def retry_after(self, key):
+        if self.limit <= 0:
+            return 0
+
+        now    = time.monotonic()
+        recent = self._recent(key, now)
+        if len(recent) < self.limit:
+            return 0
+
+        return recent[-self.limit] + self.window - now
+
+    def record(self, key):
+        if self.limit <= 0:
+            return
+
+        now    = time.monotonic()
+        recent = self._recent(key, now) + (now,)
+        self.attempts.put(key, recent[-self.limit:])
+
+    def reset(self, key):
+        self.attempts.pop(key)
@@ -0,0 +1,288 @@
+import grpc
+import time
+import queue
+import threading
+import collections
+import concurrent.futures
+
+from backends import error_code, is_failover_error
+
+SEND_MODE_STREAM = "stream"
+SEND_MODE_UNARY  = "unary"
+SEND_MODE_BATCH  = "batch"
+
+# a broken stream is reopened at most this often, so a backend that is down does not cost a call and a thread per frame
+REOPEN_DELAY_S = 1.0
+
+class StreamClosed(grpc.RpcError):
+    pass
+
+class InFlight:
+    # a frame holding a slot of the window, whichever path finishes it first completes it and later calls do nothing
+    def __init__(self, backend, release, done):
+        self.backend   = backend
+        self.release   = release
+        self.done      = done
+        self.queued    = False
+        self.completed = False
+
+    def abandon(self):
+        if self.completed:
+            return False
+
+        self.completed = True
+        self.backend.release()
+        self.release()
+
+        return True
+
+    def refuse(self, error):
+        # the frame never reached the backend, so its health is left alone
+        if self.abandon():
+            self.done(error)
+
+    def __call__(self, error = None):
+        if not self.abandon():
+            return
+
+        if error is None:
+            self.backend.succeeded()
+        elif is_failover_error(error):
+            self.backend.failed()
+
+        self.done(error)
+
+class AckQueue:
+    def __init__(self):
+        self.pending   = collections.deque()
+        self.lock      = threading.Lock()
+        self.error     = None
+        self.failed_at = None
+
+    def push(self, done):
+        with self.lock:
+            if self.error is not None:
+                raise self.error
+
+            self.pending.append(done)
+
+    def ack(self):
+        # the server acknowledges every frame once, in the order it received them
+        with self.lock:
+            done = self.pending.popleft() if self.pending else None
+
+        if done is not None:
+            done(None)
+
+    def fail(self, error):
+        # the first error wins, every frame still waiting is failed with it exactly once
+        with self.lock:
+            if self.error is None:
+                self.error     = error
+                self.failed_at = time.monotonic()
+
+            pending      = list(self.pending)
+            self.pending = collections.deque()
+
+        for done in pending:
+            done(self.error)
+
+    def broken(self):
+        # the reader records why the call ended, acks still buffered when it did are delivered first
+        return self.error is not None
+
+class FrameStream:
+    def __init__(self, stub):
+        self.requests = queue.Queue()
+        self.acks     = AckQueue()
+        self.call     = stub.StreamFramesAcked(self._iterate())
+        self.reader   = threading.Thread(target = self._read, name = "frame-acks", daemon = True)
+        self.reader.start()
+
+    def _iterate(self):
+        while True:
+            message = self.requests.get()
+            if message is None:
+                return
+
+            yield message
+
+    def _read(self):
+        error = None
+        try:
+            for _ in self.call:
+                self.acks.ack()
+        except grpc.RpcError as e:
+            error = e
+
+        self.acks.fail(error or StreamClosed("frame stream closed by server"))
+
+    def put(self, message, done):
+        self.acks.push(done)
+        self.requests.put(message)
+
+    def close(self, timeout: float = None):
+        self.requests.put(None)
+        if threading.current_thread() is self.reader:
+            return
+
+        self.reader.join(timeout)
+        if self.reader.is_alive():
+            # failed before the cancel, so frames that never got their ack are retried rather than lost
+            self.acks.fail(TimeoutError("frame stream closed before every frame was acknowledged"))
+            self.call.cancel()
+            self.reader.join()
+
+class WindowedSender:
+    # the window, ack and fallback bookkeeping of the threaded and the async sender, only their grpc calls differ
+    def __init__(self, router, camera_id: str, mode: str, window: int, timeout: float, dispatcher = None):
+        self.router     = router
+        self.camera_id  = camera_id
+        self.mode       = mode
+        self.dispatcher = dispatcher
+        self.window     = max(1, window)
+        self.timeout    = timeout
+        self.backend    = None
+        self.stub       = None
+        self.stream     = None
+
+    def _held(self, backend):
+        # until the backend is healthy again and the delay has passed, frames fail with the error that broke the stream
+        stream = self.stream
+        if stream is None or not stream.acks.broken():
+            return None
+
+        if backend.healthy() and time.monotonic() - stream.acks.failed_at >= REOPEN_DELAY_S:
+            return None
+
+        return stream.acks.error
+
+    def _full(self):
+        return TimeoutError(f"{self.window} frames of camera {self.camera_id} are still waiting for an ack")
+
+    def _acked(self, stub, message, frame):
+        def acked(error):
+            if error_code(error) != grpc.StatusCode.UNIMPLEMENTED:
+                frame(error)
+                return
+
+            if self.mode == SEND_MODE_STREAM:
+                print("grpc server does not implement StreamFramesAcked, falling back to unary SendFrame")
+                self.mode = SEND_MODE_UNARY
+
+            # resent on the stub it was first written to, the camera may have moved to another backend since
+            self._fallback(stub, message, frame)
+
+        return acked
+
+    def _submit(self, backend, message):
+        # the batcher completes the frame on its own thread, so the next frames fill the window meanwhile
+        return self.dispatcher.batcher(backend).submit(message)
+
+class FrameSender(WindowedSender):
+    def __init__(self, router, camera_id: str, mode: str = SEND_MODE_STREAM, window: int = 8, timeout: float = 5.0, dispatcher = None):
+        super().__init__(router, camera_id, mode, window, timeout, dispatcher)
+        self.slots = threading.BoundedSemaphore(self.window)
+
+    def send(self, message, done = None):
+        # without a callback the frame is sent on its own and its outcome waited for
+        if done is None:
+            return self._wait(message)
+
+        backend = self.router.route(self.camera_id)
+        if backend is not self.backend:
+            self._switch(backend)
+
+        try:
+            self._acquire(backend)
+        except Exception as e:
+            done(e)
+            return
+
+        frame = InFlight(backend, self.slots.release, done)
+        try:
+            if self.mode == SEND_MODE_STREAM:
+                self._send_stream(message, frame)
+                return
+
+            if self.mode == SEND_MODE_BATCH:
+                self._submit(backend, message).add_done_callback(lambda future: frame(future.exception()))
+                return
+
+            self.stub.SendFrame(message, timeout = self.timeout)
+        except Exception as e:
+            frame(e)
+            return
+
+        frame()
+
+    def _wait(self, message):
+        outcome = concurrent.futures.Future()
+        self.send(message, lambda error: outcome.set_exception(error) if error is not None else outcome.set_result(None))
+
+        return outcome.result(timeout = self.timeout * 2)
+
+    def _acquire(self, backend):
+        # a frame holds its slot until it is acknowledged, so window bounds the frames in flight per camera
+        if not self.slots.acquire(timeout = self.timeout):
+            raise self._full()
+
+        try:
+            backend.acquire(self.timeout)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def _send_stream(self, message, frame):
+        error = self._held(frame.backend)
+        if error is not None:
+            frame.refuse(error)
+            return
+
+        if self.stream is None or self.stream.acks.broken():
+            self._reset_stream()
+            self.stream = FrameStream(self.stub)
+
+        self.stream.put(message, self._acked(self.stub, message, frame))
+
+    def _fallback(self, stub, message, frame):
+        try:
+            stub.SendFrame(message, timeout = self.timeout)
+        except Exception as e:
+            frame(e)
+            return
+
+        frame()
+
+    def _switch(self, backend):
+        # frames in flight on the old backend still get their acks before its stream is closed
+        self._reset_stream(self.timeout)
+        if self.backend is not None:
+            self.backend.pool.release(self.camera_id)
+
+        self.backend = backend
+        self.stub    = backend.stub(self.camera_id)
+
+    def _reset_stream(self, timeout: float = 0):
+        if self.stream is not None:
+            self.stream.close(timeout = timeout)
+            self.stream = None
+
+    def _drain(self, timeout: float):
+        # every slot comes back once the frames holding them complete
+        deadline = time.monotonic() + timeout
+        taken    = 0
+        while taken < self.window and self.slots.acquire(timeout = max(0, deadline - time.monotonic())):
+            taken += 1
+
+        for _ in range(taken):
+            self.slots.release()
+
+    def close(self):
+        # frames still in flight get until the timeout for their acks
+        if self.mode == SEND_MODE_BATCH:
+            self._drain(self.timeout * 2)
+
+        self._reset_stream(self.timeout)
+        if self.backend is not None:
+            self.backend.pool.release(self.camera_id)
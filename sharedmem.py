@@ -0,0 +1,125 @@
+import os
+import re
+import mmap
+import struct
+import secrets
+import numpy as np
+import frame_pb2
+
+from multiprocessing import shared_memory
+
+SHM_ROOT = "/dev/shm"
+
+# every slot starts with its generation, payload length and the last generation the reader consumed
+SLOT_HEADER = struct.Struct("<QQQ")
+CONSUMED    = struct.Struct("<Q")
+
+def segment_name(camera_id: str):
+    return "lugh-" + re.sub(r"[^A-Za-z0-9_-]", "_", camera_id)[:32] + "-" + secrets.token_hex(4)
+
+class SharedRing:
+    def __init__(self, camera_id: str, slots: int = 16, slot_size: int = 4 * 1024 * 1024):
+        self.slots      = max(2, slots)
+        self.slot_size  = slot_size
+        self.stride     = SLOT_HEADER.size + slot_size
+        self.shm        = shared_memory.SharedMemory(name = segment_name(camera_id), create = True, size = self.slots * self.stride)
+        self.name       = self.shm.name
+        self.generation = 0
+        self.overflows  = 0
+        self.busy       = 0
+
+    def write(self, buffer):
+        array = np.asarray(buffer)
+        if array.nbytes > self.slot_size:
+            self.overflows += 1
+            return None
+
+        slot   = (self.generation + 1) % self.slots
+        header = slot * self.stride
+        offset = header + SLOT_HEADER.size
+
+        # the reader has not consumed this slot yet, the frame travels inline instead of overwriting it
+        generation, _, consumed = SLOT_HEADER.unpack_from(self.shm.buf, header)
+        if generation and consumed != generation:
+            self.busy += 1
+            return None
+
+        self.generation += 1
+
+        # the zero generation marks the slot as being written until the payload is in place
+        SLOT_HEADER.pack_into(self.shm.buf, header, 0, 0, 0)
+        np.frombuffer(self.shm.buf, dtype = np.uint8, count = array.nbytes, offset = offset).reshape(array.shape)[...] = array
+        SLOT_HEADER.pack_into(self.shm.buf, header, self.generation, array.nbytes, 0)
+
+        return frame_pb2.SharedSlot(segment = self.name, slot = slot, offset = offset, length = array.nbytes, generation = self.generation)
+
+    def take(self, shared):
+        # a frame that never reached the reader is copied out and its slot handed back to the writer
+        header = shared.offset - SLOT_HEADER.size
+        try:
+            if SLOT_HEADER.unpack_from(self.shm.buf, header)[:2] != (shared.generation, shared.length):
+                return None
+
+            data = bytes(self.shm.buf[shared.offset:shared.offset + shared.length])
+            CONSUMED.pack_into(self.shm.buf, shared.offset - CONSUMED.size, shared.generation)
+        except (TypeError, ValueError):
+            # the segment was already released by a stopping pipeline
+            return None
+
+        return data
+
+    def status(self):
+        return {
+            "segment"   : self.name,
+            "slots"     : self.slots,
+            "slot_size" : self.slot_size,
+            "written"   : self.generation,
+            "busy"      : self.busy,
+            "overflows" : self.overflows,
+        }
+
+    def close(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+class SharedRingReader:
+    def __init__(self, root: str = SHM_ROOT):
+        self.root     = root
+        self.segments = {}
+
+    def _attach(self, name: str):
+        segment = self.segments.get(name)
+        if segment is None:
+            # mapped directly rather than through SharedMemory, so the reader's resource tracker never unlinks the writer's segment
+            with open(os.path.join(self.root, name.lstrip("/")), "r+b") as f:
+                segment = mmap.mmap(f.fileno(), 0)
+            self.segments[name] = segment
+
+        return segment
+
+    def read(self, shared):
+        try:
+            segment = self._attach(shared.segment)
+        except FileNotFoundError:
+            return None
+
+        header = shared.offset - SLOT_HEADER.size
+        if SLOT_HEADER.unpack_from(segment, header)[:2] != (shared.generation, shared.length):
+            return None
+
+        data = segment[shared.offset:shared.offset + shared.length]
+        CONSUMED.pack_into(segment, shared.offset - CONSUMED.size, shared.generation)
+
+        return data
+
+    def detach(self, name: str):
+        segment = self.segments.pop(name, None)
+        if segment is not None:
+            segment.close()
+
+    def close(self):
+        for name in list(self.segments):
+            self.detach(name)
@@ -0,0 +1,207 @@
+import os
+import re
+import time
+import zlib
+import fcntl
+import struct
+import threading
+import frame_pb2
+
+# every record is its payload length, the crc32 of the payload and the capture time, followed by the serialized frame
+RECORD = struct.Struct("<IIq")
+
+SEGMENT_SUFFIX = ".seg"
+
+LOCK_NAME = ".lock"
+
+class SpoolBusy(RuntimeError):
+    pass
+
+def spool_directory(root: str, camera_id: str):
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_-]", "_", camera_id))
+
+class FrameSpool:
+    def __init__(self, root: str, camera_id: str, max_bytes: int = 512 * 1024 * 1024, segment_bytes: int = 16 * 1024 * 1024, retention: float = 86400.0, sample_every: int = 1, lock_timeout: float = 10.0):
+        self.directory     = spool_directory(root, camera_id)
+        self.max_bytes     = max_bytes
+        self.segment_bytes = max(RECORD.size, min(segment_bytes, max_bytes // 2))
+        self.retention     = retention
+        self.sample_every  = max(1, sample_every)
+        self.lock          = threading.Lock()
+        self.writer        = None
+        self.writer_path   = None
+        self.reader        = None
+        self.reader_path   = None
+        self.reader_offset = 0
+        self.candidates    = 0
+        self.spooled       = 0
+        self.evicted       = 0
+        self.expired       = 0
+        self.corrupt       = 0
+
+        os.makedirs(self.directory, exist_ok = True)
+        self.lock_file = open(os.path.join(self.directory, LOCK_NAME), "a")
+        self._lock_directory(lock_timeout)
+
+        # segments left by an earlier run are replayed as well
+        self.segments = sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        self.bytes    = sum(os.path.getsize(path) for path in self.segments)
+
+    def _lock_directory(self, timeout: float):
+        # an earlier stream of the same camera may still be shutting down, in this process or another worker
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    self.lock_file.close()
+                    raise SpoolBusy(f"spool directory {self.directory} is still used by another stream")
+
+            time.sleep(0.05)
+
+    def sampled(self, message):
+        if self.sample_every == 1:
+            return True
+
+        # a packet without its keyframe cannot be decoded, so sampling only ever keeps keyframes
+        if not message.keyframe:
+            return False
+
+        self.candidates += 1
+
+        return (self.candidates - 1) % self.sample_every == 0
+
+    def append(self, message):
+        if not self.sampled(message):
+            return False
+
+        payload = message.SerializeToString()
+        record  = RECORD.pack(len(payload), zlib.crc32(payload), message.captured_at_us) + payload
+        if len(record) > self.segment_bytes:
+            return False
+
+        with self.lock:
+            if self.writer is None or self.writer.tell() + len(record) > self.segment_bytes:
+                self._rotate()
+
+            self.writer.write(record)
+            self.writer.flush()
+            self.bytes   += len(record)
+            self.spooled += 1
+
+            self._expire()
+            while self.bytes > self.max_bytes and len(self.segments) > 1:
+                self._remove(self.segments[0])
+                self.evicted += 1
+
+        return True
+
+    def next(self):
+        with self.lock:
+            self._expire()
+
+            while self.segments:
+                if self.reader is None:
+                    self._open_reader()
+
+                self.reader.seek(self.reader_offset)
+                header = self.reader.read(RECORD.size)
+                if len(header) == RECORD.size:
+                    length, crc, _ = RECORD.unpack(header)
+                    payload        = self.reader.read(length)
+                    if len(payload) == length and zlib.crc32(payload) == crc:
+                        return frame_pb2.Frame.FromString(payload), self.reader_offset + RECORD.size + length
+
+                    # a torn write from a crash, nothing after it in this segment can be trusted
+                    self.corrupt += 1
+                elif header:
+                    self.corrupt += 1
+
+                self._remove(self.reader_path)
+
+            return None
+
+    def commit(self, offset: int):
+        with self.lock:
+            if self.reader is not None:
+                self.reader_offset = offset
+
+    def _open_reader(self):
+        # the segment still being written is closed first, so the reader never races the writer
+        if self.segments[0] == self.writer_path:
+            self._close_writer()
+
+        self.reader_path   = self.segments[0]
+        self.reader        = open(self.reader_path, "rb")
+        self.reader_offset = 0
+
+    def _rotate(self):
+        self._close_writer()
+
+        # segment names are their creation time, so sorting them gives the order they were written in
+        stamp = time.time_ns() // 1000
+        while os.path.join(self.directory, f"{stamp:020d}{SEGMENT_SUFFIX}") in self.segments:
+            stamp += 1
+        path = os.path.join(self.directory, f"{stamp:020d}{SEGMENT_SUFFIX}")
+
+        self.writer      = open(path, "ab")
+        self.writer_path = path
+        self.segments.append(path)
+
+    def _close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+
+        self.writer      = None
+        self.writer_path = None
+
+    def _expire(self):
+        if self.retention <= 0:
+            return
+
+        deadline = time.time() - self.retention
+        while self.segments and self.segments[0] != self.writer_path and os.path.getmtime(self.segments[0]) < deadline:
+            self._remove(self.segments[0])
+            self.expired += 1
+
+    def _remove(self, path: str):
+        if path == self.writer_path:
+            self._close_writer()
+
+        if path == self.reader_path:
+            self.reader.close()
+            self.reader        = None
+            self.reader_path   = None
+            self.reader_offset = 0
+
+        self.segments.remove(path)
+        try:
+            self.bytes -= os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def status(self):
+        return {
+            "directory" : self.directory,
+            "segments"  : len(self.segments),
+            "bytes"     : self.bytes,
+            "spooled"   : self.spooled,
+            "evicted"   : self.evicted,
+            "expired"   : self.expired,
+            "corrupt"   : self.corrupt,
+        }
+
+    def close(self):
+        with self.lock:
+            self._close_writer()
+            if self.reader is not None:
+                self.reader.close()
+                self.reader      = None
+                self.reader_path = None
+
+            if not self.lock_file.closed:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+                self.lock_file.close()
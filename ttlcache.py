@@ -0,0 +1,96 @@
+import time
+import heapq
+import threading
+import collections
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self.items   = collections.OrderedDict()
+        self.lock    = threading.Lock()
+        self.hits    = 0
+        self.misses  = 0
+
+    def get(self, key, default = None):
+        now = time.monotonic()
+
+        with self.lock:
+            item = self.items.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self.items[key]
+                self.misses += 1
+                return default
+
+            self.items.move_to_end(key)
+            self.hits += 1
+
+            return item[0]
+
+    def put(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + ttl)
+            self.items.move_to_end(key)
+
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last = False)
+
+    def pop(self, key):
+        with self.lock:
+            item = self.items.pop(key, None)
+
+        return item[0] if item is not None else None
+
+    def discard(self, match):
+        with self.lock:
+            keys = [key for key, (value, _) in self.items.items() if match(value)]
+            for key in keys:
+                del self.items[key]
+
+        return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def status(self):
+        return {"size": len(self.items), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+class ExpiringSet:
+    def __init__(self):
+        self.items  = {}
+        self.expiry = []
+        self.lock   = threading.Lock()
+
+    def add(self, key, ttl: float):
+        if ttl <= 0:
+            return
+
+        now     = time.monotonic()
+        expires = now + ttl
+        with self.lock:
+            self._purge(now)
+            if expires > self.items.get(key, 0):
+                self.items[key] = expires
+                heapq.heappush(self.expiry, (expires, key))
+
+    def __contains__(self, key):
+        with self.lock:
+            expires = self.items.get(key)
+
+        return expires is not None and expires > time.monotonic()
+
+    def _purge(self, now: float):
+        # unlike the LRU above nothing is dropped before it expires, so the set only holds what is still live
+        while self.expiry and self.expiry[0][0] <= now:
+            expires, key = heapq.heappop(self.expiry)
+            if self.items.get(key) == expires:
+                del self.items[key]
+
+    def status(self):
+        return {"size": len(self.items)}
@@ -0,0 +1,342 @@
+import os
+import time
+import collections
+import threading
+import multiprocessing
+
+from sender import FrameSender, SEND_MODE_BATCH
+from batching import BatchDispatcher
+from backends import create_router
+from pipeline import build_pipeline, STATE_FAILED
+
+def create_sender_factory(router, send_mode: str, window: int, dispatcher = None):
+    def sender_factory(camera_id: str):
+        return FrameSender(router, camera_id, mode = send_mode, window = window, dispatcher = dispatcher)
+
+    return sender_factory
+
+class LocalWorker:
+    def __init__(self, router, send_mode: str, window: int, batch: dict = None):
+        self.router         = router
+        self.dispatcher     = BatchDispatcher(**(batch or {})) if send_mode == SEND_MODE_BATCH else None
+        self.sender_factory = create_sender_factory(router, send_mode, window, self.dispatcher)
+        self.pipelines      = {}
+        self.lock           = threading.Lock()
+
+    def running(self, camera_id: str):
+        pipeline = self.pipelines.get(camera_id)
+
+        return pipeline is not None and pipeline.running
+
+    def start(self, spec: dict):
+        # /connect calls in from several threads, two starts of one camera must not both build a pipeline
+        with self.lock:
+            if self.running(spec["camera_id"]):
+                return False
+
+            pipeline = build_pipeline(spec, self.sender_factory)
+            self.pipelines[spec["camera_id"]] = pipeline
+            pipeline.start()
+
+        return True
+
+    def stop(self, camera_id: str, timeout: float = 5.0):
+        with self.lock:
+            pipeline = self.pipelines.get(camera_id)
+            if pipeline is None:
+                return False
+
+            # joined, so a camera connected again right away never runs next to its old threads
+            pipeline.stop(timeout = timeout)
+            self.pipelines.pop(camera_id, None)
+
+        return True
+
+    def status(self):
+        return [
+            pipeline.status()
+            for pipeline in self.pipelines.values()
+            if pipeline.running or pipeline.state == STATE_FAILED
+        ]
+
+    def latency(self):
+        return {camera_id: pipeline.latency.snapshot() for camera_id, pipeline in self.pipelines.items()}
+
+    def metrics(self):
+        return {camera_id: pipeline.metrics() for camera_id, pipeline in self.pipelines.items()}
+
+    def snapshot(self, camera_id: str, known = ()):
+        if not self.running(camera_id):
+            return None
+
+        return self.pipelines[camera_id].snapshot(known)
+
+    def reconfigure(self, camera_id: str, detector: dict = None, regions: list = None):
+        if not self.running(camera_id):
+            return False
+
+        self.pipelines[camera_id].reconfigure(detector, regions)
+
+        return True
+
+    def backends(self):
+        data = self.router.status()
+        if self.dispatcher is not None:
+            for backend in data:
+                backend["batch"] = self.dispatcher.status(backend["target"])
+
+        return data
+
+    def shutdown(self, timeout: float = 2.0):
+        with self.lock:
+            pipelines = list(self.pipelines.values())
+
+        for pipeline in pipelines:
+            pipeline.stop(timeout = timeout)
+
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+
+        self.router.close()
+
+def worker_main(conn, router_config: dict, send_mode: str, window: int, batch: dict = None):
+    worker = LocalWorker(create_router(**router_config), send_mode, window, batch)
+
+    while True:
+        try:
+            call_id, command, payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if command == "shutdown":
+            break
+        elif command == "start":
+            result = worker.start(payload)
+        elif command == "stop":
+            result = worker.stop(*payload)
+        elif command == "running":
+            result = worker.running(payload)
+        elif command == "status":
+            result = worker.status()
+        elif command == "backends":
+            result = worker.backends()
+        elif command == "latency":
+            result = worker.latency()
+        elif command == "metrics":
+            result = worker.metrics()
+        elif command == "snapshot":
+            result = worker.snapshot(*payload)
+        elif command == "reconfigure":
+            result = worker.reconfigure(*payload)
+        else:
+            result = None
+
+        # the id lets the supervisor tell this answer from one to a call it already gave up on
+        conn.send((call_id, result))
+
+    worker.shutdown()
+
+class WorkerProcess:
+    def __init__(self, index: int, context, args):
+        self.index   = index
+        self.context = context
+        self.args    = args
+        self.lock    = threading.Lock()
+        self.specs   = {}
+        self.calls   = 0
+        self.spawn()
+
+    def spawn(self):
+        self.conn, child = self.context.Pipe()
+        self.process     = self.context.Process(
+            target = worker_main,
+            args   = (child,) + self.args,
+            name   = f"stream-worker-{self.index}",
+            daemon = True
+        )
+        self.process.start()
+        child.close()
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def call(self, command: str, payload = None, timeout: float = 10.0):
+        with self.lock:
+            return self._call(command, payload, timeout)
+
+    def _call(self, command: str, payload, timeout: float):
+        self.calls += 1
+        self.conn.send((self.calls, command, payload))
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.conn.poll(remaining):
+                raise TimeoutError(f"stream worker {self.index} did not answer {command}")
+
+            # a late answer to a call that timed out is dropped instead of being taken for this one
+            call_id, result = self.conn.recv()
+            if call_id == self.calls:
+                return result
+
+    def start(self, spec: dict):
+        # specs only change under the lock, a respawn restarts them while holding it
+        with self.lock:
+            started = self._call("start", spec, 10.0)
+            if started:
+                self.specs[spec["camera_id"]] = spec
+
+        return started
+
+    def stop(self, camera_id: str, timeout: float):
+        with self.lock:
+            self.specs.pop(camera_id, None)
+            if not self.alive():
+                return True
+
+            # the worker joins the pipeline, so its answer has to be waited for a little longer
+            return self._call("stop", (camera_id, timeout), timeout + 10.0)
+
+    def reconfigure(self, camera_id: str, detector: dict = None, regions: list = None):
+        with self.lock:
+            # a respawned worker restarts the camera with what it was last told
+            spec = self.specs.get(camera_id)
+            if spec is not None:
+                self.specs[camera_id] = dict(spec, detector = detector, regions = regions)
+
+            return self._call("reconfigure", (camera_id, detector, regions), 10.0)
+
+    def check(self):
+        # under the lock, so concurrent requests that find the worker dead restart its cameras only once
+        with self.lock:
+            if not self.alive():
+                self._respawn()
+
+    def _respawn(self):
+        print(f"stream worker {self.index} died, restarting {len(self.specs)} cameras")
+
+        self.conn.close()
+        self.spawn()
+        for spec in self.specs.values():
+            self._call("start", spec, 10.0)
+
+    def shutdown(self, timeout: float = 5.0):
+        try:
+            with self.lock:
+                self.conn.send((0, "shutdown", None))
+        except (OSError, EOFError):
+            pass
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+class WorkerSupervisor:
+    def __init__(self, processes: int, router_config: dict, send_mode: str, window: int, batch: dict = None):
+        context          = multiprocessing.get_context("spawn")
+        self.workers     = [WorkerProcess(i, context, (router_config, send_mode, window, batch)) for i in range(processes)]
+        self.assignments = {}
+        self.lock        = threading.Lock()
+
+    def _worker(self, camera_id: str):
+        with self.lock:
+            index = self.assignments.get(camera_id)
+            if index is None:
+                # counted from the assignments, which concurrent starts claim before any of them is answered
+                counts = collections.Counter(self.assignments.values())
+                index  = min(range(len(self.workers)), key = lambda i: counts[i])
+                self.assignments[camera_id] = index
+
+        return self.workers[index]
+
+    def _check(self, worker):
+        worker.check()
+
+    def running(self, camera_id: str):
+        if camera_id not in self.assignments:
+            return False
+
+        worker = self._worker(camera_id)
+        self._check(worker)
+
+        return worker.call("running", camera_id)
+
+    def start(self, spec: dict):
+        worker = self._worker(spec["camera_id"])
+        self._check(worker)
+
+        return worker.start(spec)
+
+    def stop(self, camera_id: str, timeout: float = 5.0):
+        if camera_id not in self.assignments:
+            return False
+
+        worker = self._worker(camera_id)
+        with self.lock:
+            self.assignments.pop(camera_id, None)
+
+        return worker.stop(camera_id, timeout)
+
+    def status(self):
+        data = []
+        for worker in self.workers:
+            self._check(worker)
+            for camera in worker.call("status"):
+                camera.update({"worker": worker.index, "pid": worker.process.pid})
+                data.append(camera)
+
+        return data
+
+    def latency(self):
+        data = {}
+        for worker in self.workers:
+            self._check(worker)
+            data.update(worker.call("latency"))
+
+        return data
+
+    def metrics(self):
+        data = {}
+        for worker in self.workers:
+            self._check(worker)
+            data.update(worker.call("metrics"))
+
+        return data
+
+    def snapshot(self, camera_id: str, known = ()):
+        if camera_id not in self.assignments:
+            return None
+
+        worker = self._worker(camera_id)
+        self._check(worker)
+
+        return worker.call("snapshot", (camera_id, known))
+
+    def reconfigure(self, camera_id: str, detector: dict = None, regions: list = None):
+        if camera_id not in self.assignments:
+            return False
+
+        worker = self._worker(camera_id)
+        self._check(worker)
+
+        return worker.reconfigure(camera_id, detector, regions)
+
+    def backends(self):
+        data = []
+        for worker in self.workers:
+            self._check(worker)
+            for backend in worker.call("backends"):
+                backend.update({"worker": worker.index})
+                data.append(backend)
+
+        return data
+
+    def shutdown(self, timeout: float = 5.0):
+        for worker in self.workers:
+            worker.shutdown(timeout)
+
+def worker_count(value: str):
+    if value == "auto":
+        return os.cpu_count() or 1
+
+    return int(value)